@@ -0,0 +1,139 @@
+"""
+Microbenchmarks of the per-step cost of all the solver classes,
+on the models from the book and on the synthetic Chain system of
+growing size. For each solver and problem the script reports the
+time per step, the time per RHS evaluation, the share of the time
+spent outside the RHS (the solver overhead), and the peak memory.
+For the Chain problems it also estimates how the time per step
+scales with neq, as the exponent p in time ~ neq**p.
+
+The results can be saved as JSON and compared with an earlier run,
+e.g. before and after upgrading:
+
+python benchmark_solvers.py --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+import numpy as np
+from problems import (fixed_step_solvers, adaptive_solvers, implicit_solvers,
+                      model_problems, chain_problem)
+
+
+def run(solver_class, problem, timing=False):
+    solver = solver_class(problem.model)
+    solver.set_timing(timing)
+    t0 = time.perf_counter()
+    problem.solve(solver)
+    return time.perf_counter() - t0, solver.stats
+
+
+def benchmark(solver_class, problem, repeat=3):
+    """Run one solver on one problem and return a dict of results.
+    The wall time is the best of repeat runs, while the time spent
+    in the RHS and the peak memory are measured in separate runs,
+    since the timers and tracemalloc slow the solver down."""
+    wall = min(run(solver_class, problem)[0] for _ in range(repeat))
+    _, stats = run(solver_class, problem, timing=True)
+    rhs_share = stats.times['rhs'] / stats.times['solve']
+
+    tracemalloc.start()
+    run(solver_class, problem)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    steps = stats.naccept + stats.nreject
+    return {'solver': solver_class.__name__,
+            'problem': problem.name,
+            'neq': problem.neq,
+            'steps': steps,
+            'nfev': stats.nfev,
+            'time': wall,
+            'time_per_step': wall / steps,
+            'time_per_fev': wall / stats.nfev,
+            'overhead': 1 - rhs_share,
+            'peak_memory': peak_memory}
+
+
+def scaling_exponents(results):
+    """Fit time_per_step ~ neq**p for each solver on the Chain problems."""
+    exponents = {}
+    for solver in sorted({r['solver'] for r in results}):
+        chain = [r for r in results
+                 if r['solver'] == solver and r['problem'].startswith('Chain')]
+        if len(chain) > 1:
+            neq = np.log([r['neq'] for r in chain])
+            time_per_step = np.log([r['time_per_step'] for r in chain])
+            exponents[solver] = np.polyfit(neq, time_per_step, 1)[0]
+    return exponents
+
+
+def print_results(results):
+    print(f'{"Solver":<18} {"Problem":<14} {"Steps":>7} {"nfev":>8} '
+          f'{"us/step":>10} {"us/fev":>8} {"Overhead":>9} {"Peak kB":>9}')
+    for r in results:
+        print(f'{r["solver"]:<18} {r["problem"]:<14} {r["steps"]:>7} '
+              f'{r["nfev"]:>8} {1e6 * r["time_per_step"]:>10.1f} '
+              f'{1e6 * r["time_per_fev"]:>8.1f} {r["overhead"]:>9.0%} '
+              f'{r["peak_memory"] / 1024:>9.1f}')
+
+
+def compare(results, old_results):
+    """Print the ratio of new to old time per step for all
+    solver/problem pairs found in both runs."""
+    old = {(r['solver'], r['problem']): r for r in old_results}
+    print(f'\n{"Solver":<18} {"Problem":<14} {"Old us/step":>12} '
+          f'{"New us/step":>12} {"New/old":>8}')
+    for r in results:
+        key = (r['solver'], r['problem'])
+        if key in old:
+            t_old, t_new = old[key]['time_per_step'], r['time_per_step']
+            print(f'{r["solver"]:<18} {r["problem"]:<14} {1e6 * t_old:>12.1f} '
+                  f'{1e6 * t_new:>12.1f} {t_new / t_old:>8.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--neq', type=int, nargs='+', default=[10, 100, 1000],
+                        help='sizes of the synthetic Chain problems')
+    parser.add_argument('--implicit-max-neq', type=int, default=1000,
+                        help='largest Chain problem for implicit solvers')
+    parser.add_argument('--solvers', nargs='+',
+                        help='names of the solver classes to run (default all)')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run')
+    args = parser.parse_args()
+
+    solver_classes = fixed_step_solvers + adaptive_solvers
+    if args.solvers:
+        solver_classes = [s for s in solver_classes
+                          if s.__name__ in args.solvers]
+    problems = model_problems() + [chain_problem(n) for n in args.neq]
+
+    results = []
+    for solver_class in solver_classes:
+        for problem in problems:
+            if (solver_class in implicit_solvers
+                    and problem.neq > args.implicit_max_neq):
+                continue
+            results.append(benchmark(solver_class, problem, args.repeat))
+    print_results(results)
+
+    print('\nScaling of time per step with neq (Chain problems):')
+    for solver, p in scaling_exponents(results).items():
+        print(f'{solver:<18} time ~ neq**{p:.2f}')
+
+    if args.output:
+        info = {'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+        with open(args.output, 'w') as outfile:
+            json.dump({'info': info, 'results': results}, outfile, indent=1)
+    if args.compare:
+        with open(args.compare) as infile:
+            compare(results, json.load(infile)['results'])
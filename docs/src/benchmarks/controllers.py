@@ -0,0 +1,57 @@
+"""
+Compare the step size controllers of the adaptive solvers. Each
+solver is run on each problem with each controller, and the script
+reports the accepted and rejected steps, the rejection rate and
+the RHS evaluations, to help choose the controller that needs the
+fewest evaluations.
+
+python controllers.py --problems HodgkinHuxley --solvers RKF45
+"""
+
+import argparse
+import numpy as np
+from problems import adaptive_solvers, model_problems, work_precision_problems
+from AdaptiveODESolver import (StepSizeController, PIController,
+                               H211bController, PIDController)
+
+controllers = {'elementary': StepSizeController,
+               'PI': PIController,
+               'H211b': H211bController,
+               'PID': PIDController}
+
+
+def run(solver_class, problem, controller_class):
+    solver = solver_class(problem.model)
+    solver.controller = controller_class()
+    with np.errstate(all='ignore'):
+        problem.solve(solver)
+    return solver.stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--problems', nargs='+',
+                        help='names of the problems to run (default all)')
+    parser.add_argument('--solvers', nargs='+',
+                        help='names of the solver classes to run (default all)')
+    args = parser.parse_args()
+
+    problems = model_problems() + [p for p in work_precision_problems()
+                                   if not p.stiff]
+    if args.problems:
+        problems = [p for p in problems if p.name in args.problems]
+    solver_classes = adaptive_solvers
+    if args.solvers:
+        solver_classes = [s for s in solver_classes
+                          if s.__name__ in args.solvers]
+
+    print(f'{"Solver":<18} {"Problem":<14} {"Tol":>7} {"Controller":<11} '
+          f'{"Accepted":>8} {"Rejected":>8} {"Rate":>6} {"nfev":>8}')
+    for solver_class in solver_classes:
+        for problem in problems:
+            for name, controller_class in controllers.items():
+                stats = run(solver_class, problem, controller_class)
+                print(f'{solver_class.__name__:<18} {problem.name:<14} '
+                      f'{problem.tol:>7.0e} {name:<11} '
+                      f'{stats.naccept:>8} {stats.nreject:>8} '
+                      f'{stats.rejection_rate():>6.1%} {stats.nfev:>8}')
@@ -0,0 +1,58 @@
+"""
+Compare the initial guesses (predictors) for the stage equations of
+the implicit solvers. Each solver is run on each problem with the
+constant guess and with stages extrapolated from the previous step,
+and the script reports the Newton iterations per stage solve, the
+RHS evaluations and the saving in iterations.
+
+python predictors.py --solvers Radau3 TR_BDF2_Adaptive
+"""
+
+import argparse
+import numpy as np
+from problems import implicit_solvers, model_problems, work_precision_problems
+from Rosenbrock import Rosenbrock
+
+predictors = ['constant', 'extrapolate']
+
+
+def run(solver_class, problem, predictor):
+    solver = solver_class(problem.model)
+    solver.predictor = predictor
+    with np.errstate(all='ignore'):
+        problem.solve(solver)
+    return solver.stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--problems', nargs='+',
+                        help='names of the problems to run (default all)')
+    parser.add_argument('--solvers', nargs='+',
+                        help='names of the solver classes to run (default all)')
+    args = parser.parse_args()
+
+    problems = model_problems() + [p for p in work_precision_problems()
+                                   if p.stiff]
+    if args.problems:
+        problems = [p for p in problems if p.name in args.problems]
+    # the Rosenbrock solvers have no stage equations to predict for
+    solver_classes = [s for s in implicit_solvers
+                      if not issubclass(s, Rosenbrock)]
+    if args.solvers:
+        solver_classes = [s for s in solver_classes
+                          if s.__name__ in args.solvers]
+
+    print(f'{"Solver":<18} {"Problem":<14} {"nit/solve":>19} '
+          f'{"nfev":>15} {"Saved":>6}')
+    print(f'{"":<18} {"":<14} {"const":>9} {"extrap":>9} '
+          f'{"const":>7} {"extrap":>7}')
+    for solver_class in solver_classes:
+        for problem in problems:
+            stats = [run(solver_class, problem, predictor)
+                     for predictor in predictors]
+            nit = [s.nit / s.nsolves for s in stats]
+            saved = 1 - stats[1].nit / stats[0].nit
+            print(f'{solver_class.__name__:<18} {problem.name:<14} '
+                  f'{nit[0]:>9.2f} {nit[1]:>9.2f} {stats[0].nfev:>7} '
+                  f'{stats[1].nfev:>7} {saved:>6.0%}')
@@ -0,0 +1,170 @@
+"""
+Test problems for the benchmark scripts. Most of them are the
+models from the book chapters, and Chain is a synthetic system
+of any size, for measuring how the solvers scale with neq.
+Importing this module puts the chapter directories on sys.path,
+so that the scripts can import from the chapter modules.
+"""
+
+import os
+import sys
+import numpy as np
+from scipy.sparse import diags
+
+# The solver hierarchy is complete in chapter4, so it goes first
+src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for chapter in ['chapter4', 'chapter3', 'chapter5', 'chapter1']:
+    path = os.path.join(src, chapter)
+    if path not in sys.path:
+        sys.path.append(path)
+
+# explicit imports, since star imports would also bring in the
+# test functions of the chapter modules, for pytest to collect again
+from ODESolver import ForwardEuler, Heun, ExplicitMidpoint, RungeKutta4
+from ImplicitRK import (BackwardEuler, ImplicitMidpoint, Radau2, Radau3,
+                        SDIRK2, TR_BDF2)
+from AdaptiveODESolver import (AdaptiveODESolver, EulerHeun, RKF45,
+                               DormandPrince54)
+from AdaptiveImplicitRK import TR_BDF2_Adaptive
+from Rosenbrock import ROS2, ROS3P, Rodas3
+from hodgkinhuxley import HodgkinHuxley
+from vanderpol import VanderPol
+from SEEIIR import SEEIIR
+from pendulum import Pendulum
+from forward_euler_class import Logistic
+
+
+fixed_step_solvers = [ForwardEuler, Heun, ExplicitMidpoint, RungeKutta4,
+                      BackwardEuler, ImplicitMidpoint, Radau2, Radau3,
+                      SDIRK2, TR_BDF2, ROS2, ROS3P]
+adaptive_solvers = [EulerHeun, RKF45, DormandPrince54, TR_BDF2_Adaptive,
+                    Rodas3]
+implicit_solvers = [BackwardEuler, ImplicitMidpoint, Radau2, Radau3,
+                    SDIRK2, TR_BDF2, TR_BDF2_Adaptive, ROS2, ROS3P, Rodas3]
+
+
+class Problem:
+    """
+    A model with the initial condition and time interval to solve
+    it for, the number of steps for the fixed step solvers and
+    the tolerance for the adaptive ones. stiff marks problems where
+    the explicit adaptive solvers need an impractical number of steps.
+    """
+
+    def __init__(self, name, model, u0, t_span, N, tol, stiff=False):
+        self.name = name
+        self.model = model
+        self.u0 = u0
+        self.t_span = t_span
+        self.N = N
+        self.tol = tol
+        self.stiff = stiff
+        self.neq = np.size(u0)
+
+    def solve(self, solver):
+        solver.set_initial_condition(self.u0)
+        if isinstance(solver, AdaptiveODESolver):
+            return solver.solve(self.t_span, self.tol)
+        return solver.solve(self.t_span, self.N)
+
+
+class Chain:
+    """
+    Synthetic reaction-diffusion system (Fisher's equation on a
+    chain of neq cells), u_i' = D*(u_{i-1} - 2*u_i + u_{i+1})
+    + u_i*(1 - u_i), with zero flux at the ends.
+    """
+
+    vectorized = True  # f accepts u with one state per column
+    batch = True       # and t with one time per column
+
+    def __init__(self, D=1.0):
+        self.D = D
+
+    def __call__(self, t, u, out=None):
+        if out is None:
+            out = np.zeros(np.shape(u))
+        out[1:-1] = u[:-2] - 2 * u[1:-1] + u[2:]
+        out[0] = u[1] - u[0]
+        out[-1] = u[-2] - u[-1]
+        out *= self.D
+        out += u * (1 - u)
+        return out
+
+
+class Robertson:
+    """Robertson's stiff chemical kinetics problem."""
+
+    vectorized = True
+
+    def __call__(self, t, u, out=None):
+        if out is None:
+            out = np.zeros(np.shape(u))
+        y1, y2, y3 = u
+        out[0] = -0.04 * y1 + 1e4 * y2 * y3
+        out[1] = 0.04 * y1 - 1e4 * y2 * y3 - 3e7 * y2**2
+        out[2] = 3e7 * y2**2
+        return out
+
+
+class Hires:
+    """The stiff HIRES problem (High Irradiance RESponse of plant
+    tissue), from the Hairer-Wanner test set."""
+
+    vectorized = True
+
+    def __call__(self, t, u, out=None):
+        if out is None:
+            out = np.zeros(np.shape(u))
+        y1, y2, y3, y4, y5, y6, y7, y8 = u
+        out[0] = -1.71 * y1 + 0.43 * y2 + 8.32 * y3 + 0.0007
+        out[1] = 1.71 * y1 - 8.75 * y2
+        out[2] = -10.03 * y3 + 0.43 * y4 + 0.035 * y5
+        out[3] = 8.32 * y2 + 1.71 * y3 - 1.12 * y4
+        out[4] = -1.745 * y5 + 0.43 * y6 + 0.43 * y7
+        out[5] = -280 * y6 * y8 + 0.69 * y4 + 1.71 * y5 - 0.43 * y6 \
+            + 0.69 * y7
+        out[6] = 280 * y6 * y8 - 1.81 * y7
+        out[7] = -280 * y6 * y8 + 1.81 * y7
+        return out
+
+
+def chain_problem(neq):
+    u0 = np.exp(-np.linspace(0, 10, neq)**2)
+    model = Chain()
+    model.jac_sparsity = diags([1.0, 1.0, 1.0], [-1, 0, 1], shape=(neq, neq))
+    return Problem(f'Chain{neq}', model, u0, (0, 1), N=100, tol=1e-4)
+
+
+def model_problems():
+    S0 = 5.5e6
+    return [
+        Problem('Logistic', Logistic(alpha=0.2, R=1.0), 0.1, (0, 40),
+                N=400, tol=1e-6),
+        Problem('Pendulum', Pendulum(L=1), [np.pi / 4, 0], (0, 10),
+                N=1000, tol=1e-6),
+        Problem('VanderPol', VanderPol(mu=1), [1, 0], (0, 20),
+                N=2000, tol=1e-4),
+        Problem('HodgkinHuxley', HodgkinHuxley(), [-45, 0.31, 0.05, 0.59],
+                (0, 10), N=1000, tol=1e-2),
+        Problem('SEEIIR', SEEIIR(), [S0, 0, 100, 0, 0, 0], (0, 300),
+                N=300, tol=1.0),
+    ]
+
+
+def work_precision_problems():
+    """Stiff and non-stiff problems for the work-precision
+    benchmarks. N and tol are the coarsest settings to sweep from."""
+    S0 = 5.5e6
+    return [
+        Problem('VanderPol100', VanderPol(mu=100), [2, 0], (0, 50),
+                N=250, tol=1e-2, stiff=True),
+        Problem('Robertson', Robertson(), [1, 0, 0], (0, 40),
+                N=200, tol=1e-3, stiff=True),
+        Problem('Hires', Hires(), [1, 0, 0, 0, 0, 0, 0, 0.0057],
+                (0, 321.8122), N=200, tol=1e-3, stiff=True),
+        Problem('HodgkinHuxley', HodgkinHuxley(), [-45, 0.31, 0.05, 0.59],
+                (0, 50), N=500, tol=1.0),
+        Problem('SEEIIR', SEEIIR(), [S0, 0, 100, 0, 0, 0], (0, 300),
+                N=50, tol=100.0),
+    ]
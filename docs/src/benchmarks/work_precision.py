@@ -0,0 +1,177 @@
+"""
+Work-precision benchmarks for all the solver classes, on a set of
+stiff and non-stiff problems. The fixed step solvers are run with
+a sequence of step numbers and the adaptive ones with a sequence
+of tolerances. The error at the final time is plotted against the
+wall time and against the number of RHS evaluations, which gives
+a measured basis for choosing a method for a given problem.
+
+The error is measured against a reference solution computed once
+with solve_ivp at very tight tolerances, and stored in the
+references directory for later runs.
+
+python work_precision.py --problems Robertson Hires --levels 5
+"""
+
+import argparse
+import inspect
+import json
+import os
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from scipy.integrate import solve_ivp
+from problems import (AdaptiveODESolver, fixed_step_solvers, adaptive_solvers,
+                      implicit_solvers, work_precision_problems)
+
+reference_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'references')
+
+
+def model_description(model):
+    """The parameters of the model (with functions by name) and the
+    source of its class, as a string, to detect changes of the model
+    also in constants written in the code, like those of Hires."""
+    parameters = {name: getattr(value, '__qualname__', value)
+                  for name, value in sorted(vars(model).items())}
+    try:
+        source = inspect.getsource(type(model))
+    except (OSError, TypeError):
+        source = ''
+    return f'{parameters!r}\n{source}'
+
+
+def reference_solution(problem, rtol=1e-12, atol=1e-14):
+    """Return u(T) for the problem, computed with the Radau method
+    in solve_ivp, or read from the file if it has been computed
+    before with the same model, initial condition, time interval
+    and tolerances."""
+    filename = os.path.join(reference_dir, f'{problem.name}.npz')
+    u0 = np.atleast_1d(np.asarray(problem.u0, float))
+    model = model_description(problem.model)
+    if os.path.exists(filename):
+        ref = np.load(filename)
+        if ('model' in ref.files
+                and str(ref['model']) == model
+                and np.array_equal(ref['tol'], [rtol, atol])
+                and np.array_equal(ref['u0'], u0)
+                and np.array_equal(ref['t_span'], problem.t_span)):
+            return ref['u_T']
+
+    sol = solve_ivp(problem.model, problem.t_span, u0, method='Radau',
+                    rtol=rtol, atol=atol)
+    os.makedirs(reference_dir, exist_ok=True)
+    np.savez(filename, u0=u0, t_span=problem.t_span, u_T=sol.y[:, -1],
+             model=model, tol=[rtol, atol])
+    return sol.y[:, -1]
+
+
+def error(u_T, u_ref):
+    """Largest relative error over the components, with a floor
+    on the reference value for components that are close to zero."""
+    scale = np.maximum(np.abs(u_ref), 1e-8 * np.abs(u_ref).max())
+    return np.max(np.abs(np.ravel(u_T) - u_ref) / scale)
+
+
+def sweep(solver_class, problem, u_ref, levels, repeat=1):
+    """Solve the problem with increasing accuracy, and return
+    a list of (error, time, nfev). Runs that break down (e.g. an
+    explicit method on a stiff problem) are left out, whether they
+    give a non-finite result or raise an arithmetic or linear
+    algebra error."""
+    points = []
+    for level in range(levels):
+        solver = solver_class(problem.model)
+        solver.set_initial_condition(problem.u0)
+        times = []
+        try:
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                with np.errstate(all='ignore'):
+                    if isinstance(solver, AdaptiveODESolver):
+                        tol = problem.tol / 10**level
+                        t, u_T = solver.solve(problem.t_span, tol,
+                                              final_only=True)
+                    else:
+                        N = problem.N * 2**level
+                        t, u_T = solver.solve(problem.t_span, N,
+                                              final_only=True)
+                times.append(time.perf_counter() - t0)
+        except (ArithmeticError, np.linalg.LinAlgError):
+            continue
+        e = error(u_T, u_ref)
+        if np.isfinite(e) and e < 1:
+            points.append((e, min(times), solver.stats.nfev))
+    return points
+
+
+def plot(problem_name, results):
+    fig, (ax_time, ax_fev) = plt.subplots(1, 2, figsize=(11, 4.5))
+    for solver_name, points in results.items():
+        if points:
+            e, wall, nfev = np.transpose(points)
+            ax_time.loglog(wall, e, 'o-', label=solver_name)
+            ax_fev.loglog(nfev, e, 'o-', label=solver_name)
+    ax_time.set_xlabel('Wall time (s)')
+    ax_fev.set_xlabel('RHS evaluations')
+    for ax in (ax_time, ax_fev):
+        ax.set_ylabel('Relative error at final time')
+        ax.grid(True, which='major')
+    ax_fev.legend(fontsize='small')
+    fig.suptitle(f'Work-precision, {problem_name}')
+    fig.tight_layout()
+    fig.savefig(f'work_precision_{problem_name}.pdf')
+    return fig
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--levels', type=int, default=4,
+                        help='number of step numbers/tolerances per solver')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--problems', nargs='+',
+                        help='names of the problems to run (default all)')
+    parser.add_argument('--solvers', nargs='+',
+                        help='names of the solver classes to run (default all)')
+    parser.add_argument('--explicit-stiff', action='store_true',
+                        help='also run the explicit adaptive solvers on the '
+                        'stiff problems (very slow)')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--show', action='store_true', help='show the plots')
+    args = parser.parse_args()
+
+    problems = work_precision_problems()
+    if args.problems:
+        problems = [p for p in problems if p.name in args.problems]
+    solver_classes = fixed_step_solvers + adaptive_solvers
+    if args.solvers:
+        solver_classes = [s for s in solver_classes
+                          if s.__name__ in args.solvers]
+
+    all_results = {}
+    for problem in problems:
+        u_ref = reference_solution(problem)
+        results = {}
+        print(f'{problem.name}:')
+        for solver_class in solver_classes:
+            if (problem.stiff and solver_class in adaptive_solvers
+                    and solver_class not in implicit_solvers
+                    and not args.explicit_stiff):
+                continue
+            points = sweep(solver_class, problem, u_ref, args.levels,
+                           args.repeat)
+            results[solver_class.__name__] = points
+            if points:
+                e, wall, nfev = min(points)
+                print(f'  {solver_class.__name__:<18} {len(points)} points, '
+                      f'best error {e:.2e} in {wall:.3f} s')
+            else:
+                print(f'  {solver_class.__name__:<18} no accurate runs')
+        all_results[problem.name] = results
+        plot(problem.name, results)
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(all_results, outfile, indent=1)
+    if args.show:
+        plt.show()
@@ -3,15 +3,266 @@ Version 2 of the ODESolver class hierarchy. This class works for systems
 of ODEs and for a single (scalar) ODE.
 """
 
+import inspect
+import os
+from contextlib import contextmanager
+from time import perf_counter
 import numpy as np
 
 
+def accepts_out(f):
+    """
+    Check if the right-hand side supports the in-place calling
+    convention f(t, u, out), which stores the result in the array
+    out instead of returning a new list or array. A model may
+    declare this with the attribute inplace = True (or False),
+    otherwise an argument named out in the signature is taken
+    to mean that the convention is supported.
+    """
+    inplace = getattr(f, 'inplace', None)
+    if inplace is not None:
+        return bool(inplace)
+    try:
+        return 'out' in inspect.signature(f).parameters
+    except (TypeError, ValueError):  # no signature, e.g. a builtin
+        return False
+
+
+def finite_difference_jacobian(f, t, u, increment=None, vectorized=False):
+    """
+    Forward difference approximation of the Jacobian of f(t, u)
+    with respect to u. Component j of u is perturbed by
+    increment * max(1, |u[j]|), where increment defaults to the
+    square root of the machine precision. With vectorized=True,
+    f is called once with an (neq, neq + 1) array, holding u and
+    the perturbed states as columns (as for an ensemble), and
+    otherwise once for each column of the Jacobian.
+    """
+    u = np.array(u, float).reshape(-1)
+    neq = u.size
+    if increment is None:
+        increment = np.sqrt(np.finfo(float).eps)
+    h = increment * np.maximum(1, np.abs(u))
+    h = (u + h) - u  # make the increments exactly representable
+    U = u[:, None] + np.diag(h)
+    if vectorized:
+        F = np.reshape(f(t, np.column_stack([u, U])), (neq, neq + 1))
+        f0, F = F[:, :1], F[:, 1:]
+    else:
+        f0 = np.reshape(f(t, u), (neq, 1))
+        F = np.column_stack([np.reshape(f(t, U[:, j]), neq)
+                             for j in range(neq)])
+    return (F - f0) / h
+
+
+class TrajectoryFile:
+    """
+    Solution array stored in a .npy file and accessed through
+    np.memmap, so that it does not need to fit in memory. Rows
+    are appended with append, and the file grows along the time
+    axis by doubling its capacity when it is full. close trims the
+    file to the rows written and returns it as a memory-mapped
+    array, which can later be reopened with
+    np.load(filename, mmap_mode='r').
+    """
+
+    def __init__(self, filename, shape, capacity=1024):
+        self.filename = filename
+        self.shape = tuple(shape)  # shape of one row
+        self.n = 0                 # number of rows written
+        self.u = np.lib.format.open_memmap(
+            filename, mode='w+', dtype=float,
+            shape=(capacity,) + self.shape)
+        self.offset = self.u.offset
+
+    def append(self, rows):
+        m = len(rows)
+        if self.n + m > len(self.u):
+            self.resize(max(2 * len(self.u), self.n + m))
+        self.u[self.n:self.n + m] = rows
+        self.n += m
+
+    def resize(self, capacity):
+        self.u.flush()
+        del self.u
+        self.write_header(capacity)
+        # np.memmap extends the file to the new size
+        self.u = np.memmap(self.filename, dtype=float, mode='r+',
+                           offset=self.offset,
+                           shape=(capacity,) + self.shape)
+
+    def write_header(self, rows):
+        # numpy pads the header so that it keeps its length
+        # when the number of rows changes
+        header = {'descr': np.lib.format.dtype_to_descr(np.dtype(float)),
+                  'fortran_order': False,
+                  'shape': (rows,) + self.shape}
+        with open(self.filename, 'r+b') as fp:
+            np.lib.format.write_array_header_1_0(fp, header)
+            assert fp.tell() == self.offset, 'Header size changed'
+
+    def close(self):
+        self.u.flush()
+        del self.u
+        self.write_header(self.n)
+        row_size = int(np.prod(self.shape)) * np.dtype(float).itemsize
+        os.truncate(self.filename, self.offset + self.n * row_size)
+        return np.load(self.filename, mmap_mode='r+')
+
+
+class SolverStats:
+    """
+    Counters for the work done by one solve, available as
+    solver.stats after (or during) the solve:
+    nfev: right-hand side evaluations
+    njev: Jacobian evaluations
+    nlu: LU factorizations
+    nit: Newton iterations
+    nsolves: nonlinear (stage) equation solves
+    naccept, nreject: accepted and rejected time steps
+      (rejection_rate() is the fraction of the steps rejected)
+    If timing is on, times holds the wall-clock time in seconds
+    spent in each phase of the solve, such as 'rhs', 'nonlinear'
+    and 'solve' (the total).
+    """
+
+    def __init__(self, timing=False):
+        self.nfev = 0
+        self.njev = 0
+        self.nlu = 0
+        self.nit = 0
+        self.nsolves = 0
+        self.naccept = 0
+        self.nreject = 0
+        self.timing = timing
+        self.times = {}
+
+    @contextmanager
+    def timer(self, phase):
+        """Add the time spent in a with-block to times[phase]."""
+        if not self.timing:
+            yield
+            return
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, perf_counter() - t0)
+
+    def add_time(self, phase, seconds):
+        self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+    def rejection_rate(self):
+        """The fraction of the attempted time steps that were
+        rejected by the step size control."""
+        attempts = self.naccept + self.nreject
+        return self.nreject / attempts if attempts else 0.0
+
+    def as_dict(self):
+        counters = {name: getattr(self, name) for name in
+                    ['nfev', 'njev', 'nlu', 'nit', 'nsolves',
+                     'naccept', 'nreject']}
+        counters.update({f'time_{phase}': seconds
+                         for phase, seconds in self.times.items()})
+        return counters
+
+    def __repr__(self):
+        items = ', '.join(f'{name}={value}'
+                          for name, value in self.as_dict().items())
+        return f'SolverStats({items})'
+
+
 class ODESolver:
     def __init__(self, f):
-        # Wrap user's f in a new function that always
-        # converts list/tuple to array (or let array be array)
         self.model = f
-        self.f = lambda t, u: np.asarray(f(t, u), float)
+        self.inplace = accepts_out(f)
+        self.timing = False
+        self.stats_hooks = []
+        self.stats = SolverStats()
+        self.wrap_rhs()
+
+    def wrap_rhs(self, ensemble=False):
+        """
+        Wrap the user's f in two new functions. self.f(t, u)
+        always returns an array (converting list/tuple to array,
+        or letting array be array), while self.f_into(t, u, out)
+        stores the result in the existing array out. The solvers
+        use f_into with preallocated arrays, which avoids any
+        allocation for models that support f(t, u, out).
+        For an ensemble, u and out are stored as (B, neq) arrays,
+        while the model sees (neq, B).
+        Both count their calls in self.stats, see count_rhs.
+        self.f_into_uncounted is f_into without the counting, for
+        solvers that count their evaluations themselves.
+        """
+        f = self.model
+        if ensemble and self.inplace:
+            def f_into(t, u, out):
+                f(t, u.T, out.T)
+                return out
+        elif ensemble:
+            def f_into(t, u, out):
+                out.T[...] = f(t, u.T)
+                return out
+        elif self.inplace:
+            def f_into(t, u, out):
+                f(t, u, out)
+                return out
+        else:
+            def f_into(t, u, out):
+                out[...] = f(t, u)
+                return out
+
+        if self.inplace:
+            f_new = lambda t, u: f_into(t, u, np.zeros(np.shape(u)))
+        elif ensemble:
+            f_new = lambda t, u: np.asarray(f(t, u.T), float).T
+        else:
+            f_new = lambda t, u: np.asarray(f(t, u), float)
+
+        self.f = self.count_rhs(f_new)
+        self.f_into = self.count_rhs(f_into)
+        self.f_into_uncounted = f_into
+        self.ensemble = ensemble
+
+    def count_rhs(self, f):
+        """Wrap f so that each call is counted in self.stats.nfev,
+        and timed as the phase 'rhs' if timing is on."""
+        if not self.timing:
+            def counted_f(*args):
+                self.stats.nfev += 1
+                return f(*args)
+        else:
+            def counted_f(*args):
+                stats = self.stats
+                stats.nfev += 1
+                t0 = perf_counter()
+                result = f(*args)
+                stats.add_time('rhs', perf_counter() - t0)
+                return result
+        return counted_f
+
+    def set_timing(self, timing=True):
+        """Turn on (or off) timing of the phases of each solve,
+        which adds a small overhead to every call to f."""
+        self.timing = timing
+        self.wrap_rhs(self.ensemble)
+
+    def add_stats_hook(self, hook):
+        """Register a function hook(solver, stats), which is
+        called with the SolverStats at the end of each solve,
+        e.g. to forward the numbers to a profiler."""
+        self.stats_hooks.append(hook)
+
+    def start_stats(self):
+        self.stats = SolverStats(self.timing)
+        self.solve_start = perf_counter()
+
+    def finish_stats(self):
+        if self.timing:
+            self.stats.add_time('solve', perf_counter() - self.solve_start)
+        for hook in self.stats_hooks:
+            hook(self, self.stats)
 
     def set_initial_condition(self, u0):
         if np.isscalar(u0):              # scalar ODE
@@ -21,25 +272,62 @@ class ODESolver:
             u0 = np.asarray(u0)
             self.neq = u0.size           # no of equations
         self.u0 = u0
+        self.wrap_rhs()                  # undo ensemble wrapping, if any
 
-    def solve(self, t_span, N):
+    def set_ensemble_initial_condition(self, U0):
+        """Set initial conditions for an ensemble of B problems
+        with the same right-hand side, given as a (B, neq) array.
+        All members are advanced together, so the model must be
+        vectorized: it is called with u of shape (neq, B), i.e.
+        one column per member, and must return an array (or list
+        of arrays) of the same shape. Model parameters given as
+        arrays of length B vary the parameters across members.
+        solve will then return u with shape (N + 1, B, neq).
+        """
+        U0 = np.asarray(U0, float)
+        if U0.ndim != 2:
+            raise ValueError(
+                f'Ensemble initial condition must have shape (B, neq), '
+                f'got {U0.shape}')
+        self.ensemble_size, self.neq = U0.shape
+        self.u0 = U0
+        self.wrap_rhs(ensemble=True)
+
+    def solve(self, t_span, N, save_every=1, components=None,
+              final_only=False, filename=None):
         """Compute solution for
         t_span[0] <= t <= t_span[1],
         using N steps.
         Returns the solution and the 
         time points as arrays. 
+        The output can be reduced with the optional arguments:
+        save_every: only store every save_every-th time point
+            (the final time point is always stored)
+        components: indices of the solution components to store
+        final_only: only return the time and solution at t_span[1]
+        filename: write the solution to this .npy file instead of
+            keeping it in memory, see TrajectoryFile. The returned
+            u is then a memory-mapped array.
+        Only the requested output is stored, see collect_output.
         """
+        if (save_every != 1 or components is not None or final_only
+                or filename is not None):
+            rows = -(-N // save_every) + 1
+            return self.collect_output(self.solve_iter(t_span, N),
+                                       save_every, components, final_only,
+                                       filename, capacity=rows)
+
         t0, T = t_span
         self.dt = (T - t0) / N
         self.t = np.zeros(N + 1)  # N steps ~ N+1 time points
-        if self.neq == 1:
-            self.u = np.zeros(N + 1)
-        else:
-            self.u = np.zeros((N + 1, self.neq))
 
         msg = "Please set initial condition before calling solve"
         assert hasattr(self, "u0"), msg
 
+        self.u = np.zeros((N + 1,) + self.state_shape())
+        self.allocate_work_arrays()
+        self.start_stats()
+
         self.t[0] = t0
         self.u[0] = self.u0
 
@@ -47,47 +335,279 @@ class ODESolver:
             self.n = n
             self.t[n + 1] = self.t[n] + self.dt
             self.u[n + 1] = self.advance()
+        self.stats.naccept += N
+        self.finish_stats()
         return self.t, self.u
 
+    def solve_iter(self, t_span, N, chunk_size=1000):
+        """Generator version of solve, which yields the solution
+        as (t, u) chunks of (at most) chunk_size time steps. The
+        first chunk also contains the initial condition. Only the
+        current chunk is stored, so the memory use does not grow
+        with N, and the chunks can be processed as they arrive:
+
+        for t, u in solver.solve_iter(t_span, N):
+            ...
+        """
+        t0, T = t_span
+        self.dt = (T - t0) / N
+
+        msg = "Please set initial condition before calling solve"
+        assert hasattr(self, "u0"), msg
+
+        shape = self.state_shape()
+        self.allocate_work_arrays()
+        self.start_stats()
+
+        t_last, u_last = t0, self.u0
+        steps_done = 0
+        first = 0  # index of the first point to yield
+        while steps_done < N:
+            m = min(chunk_size, N - steps_done)
+            self.t = np.zeros(m + 1)
+            self.u = np.zeros((m + 1,) + shape)
+            self.t[0] = t_last
+            self.u[0] = u_last
+            for n in range(m):
+                self.n = n
+                self.t[n + 1] = self.t[n] + self.dt
+                self.u[n + 1] = self.advance()
+            steps_done += m
+            self.stats.naccept += m
+            if steps_done == N:
+                self.finish_stats()
+            t_last, u_last = self.t[-1], self.u[-1].copy()
+            yield self.t[first:], self.u[first:]
+            first = 1
+
+    def collect_output(self, chunks, save_every=1, components=None,
+                       final_only=False, filename=None, capacity=1024):
+        """Gather the solution from the (t, u) chunks of solve_iter,
+        keeping only every save_every-th time point (and the last),
+        the given components of u, or only the final time point.
+        Each chunk is released once the output is copied out of it,
+        so only the requested output grows with the number of steps.
+        If filename is given, u is written to a TrajectoryFile with
+        room for capacity time points to begin with.
+        """
+        if components is not None and self.state_shape() == ():
+            raise ValueError('components cannot be selected for a scalar ODE')
+        if final_only and filename is not None:
+            raise ValueError('filename cannot be combined with final_only')
+
+        def select(u):
+            if components is None:
+                return u.copy()
+            return u[..., components]
+
+        t_out, u_out = [], []
+        u_file = None
+        n = 0  # number of time points before the current chunk
+        for t, u in chunks:
+            if not final_only:
+                keep = slice((-n) % save_every, None, save_every)
+                t_out.append(t[keep].copy())
+                u_keep = select(u[keep])
+                if filename is None:
+                    u_out.append(u_keep)
+                else:
+                    if u_file is None:
+                        u_file = TrajectoryFile(filename, u_keep.shape[1:],
+                                                capacity)
+                    u_file.append(u_keep)
+            n += len(t)
+            t_last, u_last = t[-1], select(u[-1:])
+        if final_only:
+            return t_last, u_last[0]
+        if (n - 1) % save_every != 0:  # final point not stored yet
+            t_out.append([t_last])
+            if filename is None:
+                u_out.append(u_last)
+            else:
+                u_file.append(u_last)
+        if filename is None:
+            return np.concatenate(t_out), np.concatenate(u_out)
+        return np.concatenate(t_out), u_file.close()
+
+    def state_shape(self):
+        """The shape of the solution at a single time point."""
+        if np.ndim(self.u0) == 2:  # ensemble
+            return self.u0.shape
+        elif self.neq == 1:
+            return ()
+        else:
+            return (self.neq,)
+
+    def allocate_work_arrays(self):
+        """Allocate the arrays advance needs, once per solve.
+        The simple methods need none, so this does nothing."""
+        pass
+
     def advance(self):
         raise NotImplementedError(
             "Advance method is not implemented in the base class")
 
 
+class ExplicitRK(ODESolver):
+    """
+    Generic explicit Runge-Kutta method, defined by the
+    Butcher tableau (a, b, c). Subclasses set the tableau in
+    the constructor, or it can be passed directly:
+    ExplicitRK(f, a=a, b=b, c=c).
+    """
 
-class ForwardEuler(ODESolver):
-    def advance(self):
-        u, f, n, t = self.u, self.f, self.n, self.t
-        dt = self.dt
-        return u[n] + dt * f(t[n], u[n])
+    def __init__(self, f, a=None, b=None, c=None):
+        super().__init__(f)
+        if a is not None:
+            self.a = np.asarray(a, float)
+            self.b = np.asarray(b, float)
+            self.c = np.asarray(c, float)
+            self.stages = len(self.b)
 
-class Heun(ODESolver):
-    def advance(self):
-        u, f, n, t = self.u, self.f, self.n, self.t
-        dt = self.dt
-        k1 = f(t[n], u[n])
-        k2 = f(t[n] + dt, u[n] + dt * k1)
-        return u[n] + dt / 2 * (k1 + k2)
+    def allocate_work_arrays(self):
+        # Work arrays for the stage derivatives (one row per stage)
+        # and the stage values. They are flat, so that the stage
+        # sums become matrix-vector products. The views in the shape
+        # of u, and the nonzero terms of each stage sum, are found
+        # once here, since for small systems reshaping and summing
+        # in every step would cost more than the RHS evaluations.
+        shape = self.state_shape()
+        size = np.size(self.u0)
+        self.a = np.asarray(self.a, float)  # integer tableaus are slower
+        self.b = np.asarray(self.b, float)
+        self.c = np.asarray(self.c, float)
+        self.k = np.zeros((self.stages, size))
+        self.u_stage = np.zeros(size)
+        self.u_new = np.zeros(size)
+        self.k_views = [k_i.reshape(shape) for k_i in self.k]
+        self.u_stage_view = self.u_stage.reshape(shape)
+        self.u_new_view = self.u_new.reshape(shape)
+        self.stage_terms = [np.flatnonzero(self.a[i, :i])
+                            for i in range(self.stages)]
+        self.b_terms = np.flatnonzero(self.b)
 
-class ExplicitMidpoint(ODESolver):
-    def advance(self):
-        u, f, n, t = self.u, self.f, self.n, self.t
+    def compute_stages(self, t, u, start=0):
+        """Compute the stage derivatives for a step of length
+        self.dt from (t, u), and store them in the rows of self.k.
+        The stages before start are assumed to be in self.k already.
+        """
+        if self.timing:
+            f_into = self.f_into  # counts and times each call
+        else:
+            # an extra wrapper per call is a large part of the cost
+            # of a step for small systems, so count all stages at once
+            f_into = self.f_into_uncounted
+            self.stats.nfev += self.stages - start
+        a, c = self.a, self.c
         dt = self.dt
-        dt2 = dt / 2.0
-        k1 = f(t[n], u[n])
-        k2 = f(t[n] + dt2, u[n] + dt2 * k1)
-        return u[n] + dt * k2
+        k, k_views = self.k, self.k_views
+        u_stage, u_stage_view = self.u_stage, self.u_stage_view
+        for i in range(start, self.stages):
+            terms = self.stage_terms[i]
+            # u_stage = u + dt * sum_j a[i, j] * k[j]
+            if len(terms) == 0:
+                u_i = u
+            else:
+                if len(terms) == 1:
+                    j = terms[0]
+                    np.multiply(k[j], a[i, j] * dt, out=u_stage)
+                else:
+                    np.dot(a[i, :i], k[:i], out=u_stage)
+                    u_stage *= dt
+                u_stage_view += u
+                u_i = u_stage_view
+            f_into(t + c[i] * dt, u_i, k_views[i])
+        return k
 
-class RungeKutta4(ODESolver):
     def advance(self):
-        u, f, n, t = self.u, self.f, self.n, self.t
+        """Advance the solution one step. Note that the returned
+        array is a work array, which is overwritten in the next
+        call to advance."""
+        u, n, t = self.u, self.n, self.t
+        b = self.b
         dt = self.dt
-        dt2 = dt / 2.0
-        k1 = f(t[n], u[n],)
-        k2 = f(t[n] + dt2, u[n] + dt2 * k1, )
-        k3 = f(t[n] + dt2, u[n] + dt2 * k2, )
-        k4 = f(t[n] + dt, u[n] + dt * k3, )
-        return u[n] + (dt / 6.0) * (k1 + 2.0 * k2 + 2.0 * k3 + k4)
+        u_new = self.u_new
+        k = self.compute_stages(t[n], u[n])
+        if len(self.b_terms) == 1:
+            j = self.b_terms[0]
+            np.multiply(k[j], b[j] * dt, out=u_new)
+        else:
+            np.dot(b, k, out=u_new)
+            u_new *= dt
+        u_new_view = self.u_new_view
+        u_new_view += u[n]
+        return u_new_view
+
+
+class ForwardEuler(ExplicitRK):
+    def __init__(self, f):
+        super().__init__(f)
+        self.stages = 1
+        self.a = np.array([[0]])
+        self.c = np.array([0])
+        self.b = np.array([1])
+
+
+class Heun(ExplicitRK):
+    def __init__(self, f):
+        super().__init__(f)
+        self.stages = 2
+        self.a = np.array([[0, 0],
+                           [1, 0]])
+        self.c = np.array([0, 1])
+        self.b = np.array([1 / 2, 1 / 2])
+
+
+class ExplicitMidpoint(ExplicitRK):
+    def __init__(self, f):
+        super().__init__(f)
+        self.stages = 2
+        self.a = np.array([[0, 0],
+                           [1 / 2, 0]])
+        self.c = np.array([0, 1 / 2])
+        self.b = np.array([0, 1])
+
+
+class RungeKutta4(ExplicitRK):
+    def __init__(self, f):
+        super().__init__(f)
+        self.stages = 4
+        self.a = np.array([[0, 0, 0, 0],
+                           [1 / 2, 0, 0, 0],
+                           [0, 1 / 2, 0, 0],
+                           [0, 0, 1, 0]])
+        self.c = np.array([0, 1 / 2, 1 / 2, 1])
+        self.b = np.array([1 / 6, 1 / 3, 1 / 3, 1 / 6])
+
+
+registered_solver_classes = [ForwardEuler, Heun,
+                             ExplicitMidpoint, RungeKutta4]
+
+
+def register_tableau(name, a, b, c):
+    """
+    Create a new explicit Runge-Kutta solver class from
+    a Butcher tableau, and add it to registered_solver_classes.
+    Returns the new class, which is used like any other solver:
+
+    Kutta3 = register_tableau('Kutta3', a, b, c)
+    solver = Kutta3(f)
+    """
+    a = np.asarray(a, float)
+    b = np.asarray(b, float)
+    c = np.asarray(c, float)
+    if a.shape != (len(b), len(b)) or len(c) != len(b):
+        raise ValueError(f'Inconsistent Butcher tableau for {name}')
+    if np.any(np.triu(a) != 0):
+        raise ValueError(f'Tableau for {name} is not explicit')
+
+    def __init__(self, f):
+        ExplicitRK.__init__(self, f, a, b, c)
+
+    solver_class = type(name, (ExplicitRK,), {'__init__': __init__})
+    registered_solver_classes.append(solver_class)
+    return solver_class
+
 
 def test_exact_numerical_solution():
     """
@@ -96,13 +616,11 @@ def test_exact_numerical_solution():
     All the methods should be exact to machine precision
     for this choice.
     """
-    solver_classes = [ForwardEuler, Heun, 
-                      ExplicitMidpoint, RungeKutta4]
     a = 0.2
     b = 3
 
     def f(t, u):
-        return a  
+        return a
 
     def u_exact(t):
         """Exact u(t) corresponding to f above."""
@@ -113,7 +631,7 @@ def test_exact_numerical_solution():
     N = 10
     tol = 1E-14
     t_span = (0, T)
-    for solver_class in solver_classes:
+    for solver_class in registered_solver_classes:
         solver = solver_class(f)
         solver.set_initial_condition(u0)
         t, u = solver.solve(t_span, N)
@@ -123,5 +641,212 @@ def test_exact_numerical_solution():
         assert max_error < tol, msg
 
 
+def test_ensemble_solve():
+    """
+    Solve an ensemble of damped oscillators with different
+    initial conditions and damping parameters, and check that
+    the result is identical to solving each member separately.
+    """
+    solver_classes = [ForwardEuler, Heun,
+                      ExplicitMidpoint, RungeKutta4]
+    U0 = np.array([[1.0, 0.0], [0.5, 1.0], [-2.0, 0.3]])
+    damping = np.array([0.0, 0.1, 0.5])
+
+    def f(t, u):
+        return [u[1], -u[0] - damping * u[1]]
+
+    t_span = (0, 5)
+    N = 50
+    tol = 1E-14
+    for solver_class in solver_classes:
+        solver = solver_class(f)
+        solver.set_ensemble_initial_condition(U0)
+        t, u = solver.solve(t_span, N)
+        assert u.shape == (N + 1,) + U0.shape
+        for i, u0 in enumerate(U0):
+            def f_i(t, u):
+                return [u[1], -u[0] - damping[i] * u[1]]
+            single = solver_class(f_i)
+            single.set_initial_condition(u0)
+            t_i, u_i = single.solve(t_span, N)
+            max_error = abs(u[:, i] - u_i).max()
+            msg = f'{solver_class.__name__} failed with max_error={max_error}'
+            assert max_error < tol, msg
+
+
+def test_finite_difference_jacobian():
+    """
+    The finite difference Jacobian of a linear system should be
+    close to the matrix, with and without vectorized calls to f.
+    """
+    A = np.array([[-2.0, 1.0], [3.0, -1e3]])
+
+    def f(t, u):
+        return A @ u
+
+    for vectorized in [False, True]:
+        J = finite_difference_jacobian(f, 0, [1.0, -2e4],
+                                       vectorized=vectorized)
+        assert np.allclose(J, A, rtol=1e-6)
+
+
+def test_register_tableau():
+    """
+    Register Kutta's third order method from its tableau and
+    check that the error is reduced by a factor 8 when dt is halved.
+    """
+    Kutta3 = register_tableau('Kutta3',
+                              a=[[0, 0, 0], [1 / 2, 0, 0], [-1, 2, 0]],
+                              b=[1 / 6, 2 / 3, 1 / 6],
+                              c=[0, 1 / 2, 1])
+    registered_solver_classes.remove(Kutta3)
+    errors = []
+    for N in [20, 40]:
+        solver = Kutta3(lambda t, u: u)
+        solver.set_initial_condition(1.0)
+        t, u = solver.solve((0, 1), N)
+        errors.append(abs(u[-1] - np.exp(1)))
+    rate = errors[0] / errors[1]
+    assert abs(rate - 8) < 0.5, f'Kutta3 failed with error ratio {rate}'
+
+
+def test_inplace_rhs():
+    """
+    Check that a model using the in-place convention f(t, u, out)
+    gives the same solution as the same model returning a list.
+    """
+    class Oscillator:
+        def __call__(self, t, u):
+            return [u[1], -u[0]]
+
+    class OscillatorInPlace:
+        def __call__(self, t, u, out):
+            out[0] = u[1]
+            out[1] = -u[0]
+
+    assert not accepts_out(Oscillator())
+    assert accepts_out(OscillatorInPlace())
+    tol = 1E-14
+    for solver_class in registered_solver_classes:
+        solutions = []
+        for model in [Oscillator(), OscillatorInPlace()]:
+            solver = solver_class(model)
+            solver.set_initial_condition([1, 0])
+            t, u = solver.solve((0, 3), 30)
+            solutions.append(u)
+        max_error = abs(solutions[0] - solutions[1]).max()
+        msg = f'{solver_class.__name__} failed with max_error={max_error}'
+        assert max_error < tol, msg
+
+
+def test_solve_iter():
+    """
+    Check that the chunks from solve_iter add up to
+    the same solution as solve.
+    """
+    def f(t, u):
+        return [u[1], -u[0]]
+
+    t_span = (0, 3)
+    N = 25
+    for solver_class in registered_solver_classes:
+        solver = solver_class(f)
+        solver.set_initial_condition([1, 0])
+        t, u = solver.solve(t_span, N)
+        chunks = list(solver.solve_iter(t_span, N, chunk_size=10))
+        assert [len(t_) for t_, u_ in chunks] == [11, 10, 5]
+        t_iter = np.concatenate([t_ for t_, u_ in chunks])
+        u_iter = np.concatenate([u_ for t_, u_ in chunks])
+        msg = f'{solver_class.__name__} failed'
+        assert np.array_equal(t, t_iter) and np.array_equal(u, u_iter), msg
+
+
+def test_output_control():
+    """
+    Check that the reduced output of solve picks the right
+    time points and components from the full solution.
+    """
+    def f(t, u):
+        return [u[1], -u[0], 0.1 * u[0]]
+
+    t_span = (0, 3)
+    N = 2500
+    for solver_class in registered_solver_classes:
+        solver = solver_class(f)
+        solver.set_initial_condition([1, 0, 0])
+        t, u = solver.solve(t_span, N)
+        msg = f'{solver_class.__name__} failed'
+        t_s, u_s = solver.solve(t_span, N, save_every=100, components=[0, 2])
+        assert np.array_equal(t_s, t[::100]), msg
+        assert np.array_equal(u_s, u[::100, [0, 2]]), msg
+        t_s, u_s = solver.solve(t_span, N, save_every=300)
+        assert np.array_equal(t_s, np.append(t[::300], t[-1])), msg
+        assert np.array_equal(u_s[-1], u[-1]), msg
+        t_T, u_T = solver.solve(t_span, N, final_only=True)
+        assert t_T == t[-1] and np.array_equal(u_T, u[-1]), msg
+
+
+def test_trajectory_file():
+    """
+    Check that a solution written to a .npy file is the same
+    as the one kept in memory, and that the file can be reopened.
+    """
+    import tempfile
+
+    def f(t, u):
+        return [u[1], -u[0]]
+
+    solver = RungeKutta4(f)
+    solver.set_initial_condition([1, 0])
+    t, u = solver.solve((0, 3), 100)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'u.npy')
+        t_f, u_f = solver.solve((0, 3), 100, filename=filename)
+        assert isinstance(u_f, np.memmap)
+        assert np.array_equal(t_f, t) and np.array_equal(u_f, u)
+
+        # a small initial capacity makes the file grow several times
+        u_file = TrajectoryFile(filename, (2,), capacity=4)
+        for t_, u_ in solver.solve_iter((0, 3), 100, chunk_size=7):
+            u_file.append(u_)
+        u_file.close()
+        assert np.array_equal(np.load(filename, mmap_mode='r'), u)
+
+
+def test_solver_stats():
+    """
+    Check the RHS evaluation count, with and without timing, and
+    that stats hooks are called at the end of each solve.
+    """
+    def f(t, u):
+        return -u
+
+    reported = []
+    N = 10
+    for solver_class in registered_solver_classes:
+        solver = solver_class(f)
+        solver.set_initial_condition(1.0)
+        solver.set_timing()
+        solver.add_stats_hook(lambda solver, stats: reported.append(stats))
+        solver.solve((0, 1), N)
+        stats = solver.stats
+        msg = f'{solver_class.__name__} failed with {stats}'
+        assert stats.nfev == N * solver.stages, msg
+        assert stats.naccept == N, msg
+        assert set(stats.times) == {'rhs', 'solve'}, msg
+        assert reported[-1] is stats, msg
+        solver.set_timing(False)  # the stages are then counted per step
+        solver.solve((0, 1), N)
+        assert solver.stats.nfev == N * solver.stages, msg
+
+
 if __name__ == '__main__':
     test_exact_numerical_solution()
+    test_ensemble_solve()
+    test_finite_difference_jacobian()
+    test_register_tableau()
+    test_inplace_rhs()
+    test_solve_iter()
+    test_output_control()
+    test_trajectory_file()
+    test_solver_stats()
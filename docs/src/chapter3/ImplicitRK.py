@@ -1,46 +1,457 @@
 from ODESolver import *
+from scipy.linalg import lu_factor, lu_solve
 from scipy.optimize import root
+from scipy.sparse import csc_matrix, identity, issparse, kron
+from scipy.sparse.linalg import LinearOperator, bicgstab, gmres, splu
+
+
+def group_columns(sparsity):
+    """
+    Split the columns of a Jacobian sparsity pattern into groups
+    of columns with no nonzero rows in common (greedily), and
+    return the group number of each column. All the columns in a
+    group can be estimated with one evaluation of f.
+    """
+    S = csc_matrix(sparsity)
+    groups = np.zeros(S.shape[1], int)
+    used_rows = []  # for each group, the rows used by its columns
+    for j in range(S.shape[1]):
+        rows = S.indices[S.indptr[j]:S.indptr[j + 1]]
+        for g, used in enumerate(used_rows):
+            if not used[rows].any():
+                break
+        else:
+            g = len(used_rows)
+            used_rows.append(np.zeros(S.shape[0], bool))
+        used_rows[g][rows] = True
+        groups[j] = g
+    return groups
+
+
+def sparse_finite_difference_jacobian(f, t, u, sparsity, groups,
+                                      increment=None, vectorized=False):
+    """
+    Forward difference approximation of a Jacobian with the given
+    sparsity pattern, as a scipy.sparse matrix. The columns in each
+    group from group_columns are perturbed together, so f is only
+    evaluated once per group (or once in total if vectorized).
+    """
+    u = np.array(u, float).reshape(-1)
+    neq = u.size
+    if increment is None:
+        increment = np.sqrt(np.finfo(float).eps)
+    h = increment * np.maximum(1, np.abs(u))
+    h = (u + h) - u  # make the increments exactly representable
+    n_groups = groups.max() + 1
+    U = np.repeat(u[:, None], n_groups, axis=1)
+    U[np.arange(neq), groups] += h
+    if vectorized:
+        F = np.reshape(f(t, np.column_stack([u, U])), (neq, n_groups + 1))
+        f0, F = F[:, 0], F[:, 1:]
+    else:
+        f0 = np.reshape(f(t, u), neq)
+        F = np.column_stack([np.reshape(f(t, U[:, g]), neq)
+                             for g in range(n_groups)])
+    S = csc_matrix(sparsity).tocoo()
+    rows, cols = S.row, S.col
+    values = (F[rows, groups[cols]] - f0[rows]) / h[cols]
+    return csc_matrix((values, (rows, cols)), shape=(neq, neq))
+
+
+def copy_result(f):
+    """Wrap f so that it returns a copy of its result. The
+    stage equations may return a work array, which is overwritten
+    in the next call, while scipy.optimize.root keeps the results."""
+    return lambda *args: np.array(f(*args))
 
 
 class ImplicitRK(ODESolver):
+    def __init__(self, f, newton=True):
+        """
+        With newton=True the stage equations are solved with a
+        simplified Newton iteration, which reuses the Jacobian and
+        the LU factorization of the Newton matrix for as long as
+        the iteration converges fast enough. With newton=False they
+        are solved with scipy.optimize.root.
+
+        The Jacobian is taken from f.jacobian(t, u) if the model
+        has such a method, and otherwise approximated by finite
+        differences with relative increment jacobian_increment.
+        A model declaring the attribute vectorized = True is then
+        called once with all the perturbed states as columns.
+
+        A model declaring the attribute batch = True is called once
+        for all the stages, with t of shape (s,) and u of shape
+        (neq, s), i.e. one stage per column, instead of once per
+        stage. The returned array (or out) has the shape of u.
+
+        For large systems, the model can declare the nonzero
+        pattern of the Jacobian as the attribute jac_sparsity (an
+        array or scipy.sparse matrix). The finite differences then
+        need one evaluation of f per group of columns without
+        common rows, and the Newton matrix is factorized with
+        scipy.sparse. The same holds if model.jacobian returns a
+        scipy.sparse matrix.
+
+        The initial guess for the stage derivatives is chosen by
+        predictor: 'extrapolate' evaluates the polynomial through
+        the stage derivatives of the previous step (the derivative
+        of the collocation polynomial, for collocation methods) at
+        the new stage times, while 'constant' uses f(t[n], u[n])
+        for all stages (or, for SDIRK, the previous stage). The
+        polynomial is only used if dt is at most predictor_max_ratio
+        times the previous step, and if the Newton iteration fails
+        from it, the iteration is restarted from the constant guess.
+
+        With linear_solver = 'gmres' or 'bicgstab', the Newton
+        iteration is Jacobian-free: the linear systems are solved
+        with the Krylov method from scipy.sparse.linalg, and the
+        products of the Newton matrix with vectors are approximated
+        by finite differences of the stage equations, so no matrix
+        is formed or stored. An optional preconditioner(solver, r)
+        should return an approximate solution z of the Newton
+        system, (I - dt * (A x J)) z = r for the s * neq stage
+        derivatives (or (I - dt * gamma * J) z = r for SDIRK).
+        """
+        super().__init__(f)
+        self.newton = newton
+        self.jacobian_increment = None  # sqrt of machine precision
+        self.vectorized = getattr(f, 'vectorized', False)
+        self.batch = getattr(f, 'batch', False)
+        self.jac_sparsity = None
+        self.newton_tol = 1e-8
+        self.newton_maxiter = 10
+        self.jacobian_rate = 0.1   # refresh J if convergence is slower
+        self.refactor_ratio = 0.2  # refactor if dt changes more than this
+        self.predictor = 'extrapolate'
+        self.predictor_max_ratio = 2.0  # largest dt / dt_old to extrapolate
+        self.linear_solver = 'direct'  # or 'gmres', 'bicgstab'
+        self.preconditioner = None
+        self.krylov_dim = 20    # GMRES restart length
+        self.krylov_rtol = 1e-2  # relative tolerance of the linear solves
+
+    def allocate_work_arrays(self):
+        neq = self.neq
+        self.u_stage = np.zeros(neq)
+        self.u_stages = np.zeros((self.stages, neq))
+        self.u_new = np.zeros(neq)
+        self.J = None
+        self.solve_linear = None
+        self.newton_eta = 1.0
+        self.k_old = None
+        sparsity = getattr(self.model, 'jac_sparsity', None)
+        if sparsity is not None and sparsity is not self.jac_sparsity:
+            self.jac_groups = group_columns(sparsity)
+        self.jac_sparsity = sparsity
+
     def solve_stages(self):
         u, f, n, t = self.u, self.f, self.n, self.t
-        s = self.stages
-        k0 = f(t[n], u[n])
-        k0 = np.tile(k0,s) 
-
-        sol = root(self.stage_eq, k0)
-
-        return np.split(sol.x, s)
+        s, neq = self.stages, self.neq
+        k0 = self.predict_stages()
+        retry = None
+        if k0 is None:
+            k0 = np.tile(f(t[n], u[n]), s)
+        else:
+            retry = lambda: np.tile(f(t[n], u[n]), s)
+
+        if self.newton:
+            k = self.solve_newton(self.stage_eq, k0.reshape(-1), retry=retry)
+        else:
+            k = self.solve_nonlinear(self.stage_eq, k0.reshape(-1))
+
+        k = k.reshape(s, neq)
+        self.save_stages(k)
+        return k
+
+    def predict_stages(self):
+        """
+        Initial guess for the stage derivatives of the current step,
+        from the polynomial of degree s - 1 through the stage
+        derivatives of the previous solve (at the times
+        t_old + c * dt_old), or None if there is nothing to
+        extrapolate from. This is the case after a rejected step
+        (when t_old is the current t[n]), and when dt is more than
+        predictor_max_ratio times dt_old.
+        """
+        if self.predictor != 'extrapolate' or self.k_old is None:
+            return None
+        c, s = self.c, self.stages
+        if s < 2 or len(np.unique(c)) < s:
+            return None
+        t_old, dt_old, k_old = self.k_old
+        if t_old == self.t[self.n]:  # the previous step was rejected
+            return None
+        if self.dt > self.predictor_max_ratio * dt_old:
+            return None
+        theta = (self.t[self.n] + c * self.dt - t_old) / dt_old
+        # Lagrange basis polynomials for the nodes c, evaluated at theta
+        L = np.ones((s, s))
+        for j in range(s):
+            for m in range(s):
+                if m != j:
+                    L[:, j] *= (theta - c[m]) / (c[j] - c[m])
+        return L @ k_old
+
+    def save_stages(self, k):
+        if np.all(np.isfinite(k)):
+            self.k_old = (self.t[self.n], self.dt, np.array(k))
+        else:
+            self.k_old = None
+
+    def solve_nonlinear(self, stage_eq, k0, args=()):
+        """Solve stage_eq(k, *args) = 0 with scipy.optimize.root,
+        and record the work in self.stats. The RHS evaluations
+        are counted through stage_eq, while root itself reports
+        no Newton iterations. It starts from a finite difference
+        Jacobian, which is counted as one Jacobian evaluation."""
+        stats = self.stats
+        stats.nsolves += 1
+        stats.njev += 1
+        with stats.timer('nonlinear'):
+            sol = root(copy_result(stage_eq), k0, args=args)
+        return sol.x
+
+    def solve_newton(self, stage_eq, k0, args=(), retry=None):
+        """
+        Solve stage_eq(k, *args) = 0 with a simplified Newton
+        iteration, using the LU factorization of newton_matrix().
+        The Jacobian and the factorization are kept between calls,
+        and only updated when the iteration fails with an old
+        Jacobian, when it converged slowly in the previous call,
+        or (for the factorization) when dt has changed. If the
+        iteration fails with a Jacobian from the current time
+        point, the stages are solved with scipy.optimize.root.
+        If k0 is a prediction, retry() should return the constant
+        initial guess, and the iteration is restarted once from it
+        (before the Jacobian is updated) if it fails from k0.
+        """
+        if self.linear_solver != 'direct':
+            return self.solve_krylov(stage_eq, k0, args, retry)
+        stats = self.stats
+        stats.nsolves += 1
+        with stats.timer('nonlinear'):
+            t_n = self.t[self.n]
+            if self.J is None:
+                self.update_jacobian()
+            while True:
+                if (self.solve_linear is None or abs(self.dt / self.lu_dt - 1)
+                        > self.refactor_ratio):
+                    self.solve_linear = self.newton_solver()
+                    self.lu_dt = self.dt
+                    stats.nlu += 1
+                k, converged = self.newton_iterate(stage_eq, k0, args)
+                if converged:
+                    return k
+                if retry is not None:
+                    k0, retry = retry(), None
+                    continue
+                if self.jacobian_t == t_n:
+                    break
+                self.update_jacobian()
+
+            # Newton failed even with a fresh Jacobian
+            stats.njev += 1
+            self.J = None
+            return root(copy_result(stage_eq), k0, args=args).x
+
+    def newton_iterate(self, stage_eq, k0, args=()):
+        """
+        Simplified Newton iterations from k0 with the current
+        factorization. Returns (k, converged). The convergence rate
+        theta is estimated from successive updates, and the
+        iteration stops when the estimated remaining error
+        theta / (1 - theta) * |dk| is below the tolerance, or
+        fails if it diverges or does not converge in
+        newton_maxiter iterations.
+        """
+        stats = self.stats
+        tol = self.newton_tol
+        # error estimate for the first update, from the previous solve
+        eta = max(self.newton_eta, np.finfo(float).eps) ** 0.8
+        k = np.array(k0, float)
+        dk_norm_old = None
+        for i in range(self.newton_maxiter):
+            dk = self.solve_linear(-stage_eq(k, *args))
+            k += dk
+            stats.nit += 1
+            dk_norm = np.linalg.norm(dk) / np.sqrt(dk.size)
+            k_norm = np.linalg.norm(k) / np.sqrt(k.size)
+            if not np.isfinite(dk_norm):
+                return k, False
+            if dk_norm_old is not None:
+                theta = dk_norm / dk_norm_old
+                if theta >= 1:
+                    return k, False
+                eta = theta / (1 - theta)
+                if theta > self.jacobian_rate:
+                    self.J = None  # refresh the Jacobian in the next solve
+            if eta * dk_norm <= tol * (1 + k_norm):
+                self.newton_eta = eta
+                return k, True
+            dk_norm_old = dk_norm
+        return k, False
+
+    def solve_krylov(self, stage_eq, k0, args=(), retry=None):
+        """
+        Solve stage_eq(k, *args) = 0 with a Jacobian-free inexact
+        Newton iteration. The Newton matrix is applied to a vector v
+        as the directional difference (F(k + h * v) - F(k)) / h of
+        the stage equations F, and each linear system is solved to
+        the relative tolerance krylov_rtol with linear_solver. The
+        memory use is a few times neq * krylov_dim. If the iteration
+        fails (also from retry(), as in solve_newton), the stages are
+        solved with the (also matrix-free) Krylov method of
+        scipy.optimize.root.
+        """
+        stats = self.stats
+        stats.nsolves += 1
+        with stats.timer('nonlinear'):
+            size = np.size(k0)
+            if self.linear_solver == 'gmres':
+                options = dict(restart=self.krylov_dim, maxiter=5)
+                krylov = gmres
+            else:
+                options = dict(maxiter=5 * self.krylov_dim)
+                krylov = bicgstab
+            if self.preconditioner is not None:
+                options['M'] = LinearOperator(
+                    (size, size),
+                    matvec=lambda r: self.preconditioner(self, r))
+            sqrt_eps = np.sqrt(np.finfo(float).eps)
+
+            while True:
+                k = np.array(k0, float)
+                # stage_eq may return a work array, which matvec overwrites
+                res = stage_eq(k, *args).copy()
+                dk_norm_old = None
+                for i in range(self.newton_maxiter):
+                    h = sqrt_eps * (1 + np.linalg.norm(k))
+
+                    def matvec(v):
+                        v_norm = np.linalg.norm(v)
+                        if v_norm == 0:
+                            return np.zeros(size)
+                        return (stage_eq(k + h / v_norm * v, *args)
+                                - res) * (v_norm / h)
+
+                    A = LinearOperator((size, size), matvec=matvec)
+                    dk, info = krylov(A, -res, rtol=self.krylov_rtol,
+                                      **options)
+                    k += dk
+                    stats.nit += 1
+                    res = stage_eq(k, *args).copy()
+                    dk_norm = np.linalg.norm(dk) / np.sqrt(size)
+                    k_norm = np.linalg.norm(k) / np.sqrt(size)
+                    if not np.isfinite(dk_norm):
+                        break
+                    if dk_norm_old is not None:
+                        theta = dk_norm / dk_norm_old
+                        if theta >= 1:
+                            break
+                        if theta / (1 - theta) * dk_norm <= (
+                                self.newton_tol * (1 + k_norm)):
+                            return k
+                    elif dk_norm <= self.newton_tol * (1 + k_norm):
+                        return k
+                    dk_norm_old = dk_norm
+                if retry is None:
+                    break
+                k0, retry = np.reshape(retry(), size), None
+
+            return root(copy_result(stage_eq), k0, args=args,
+                        method='krylov').x
+
+    def update_jacobian(self):
+        t, n = self.t, self.n
+        self.J = self.jacobian(t[n], self.u[n])
+        self.jacobian_t = t[n]
+        self.solve_linear = None
+        self.stats.njev += 1
+
+    def jacobian(self, t, u):
+        """The Jacobian of f at (t, u), from the model if it has
+        a jacobian method, or by finite differences."""
+        neq = self.neq
+        u = np.array(u, float).reshape(neq)
+        if hasattr(self.model, 'jacobian'):
+            J = self.model.jacobian(t, u)
+            if issparse(J):
+                return csc_matrix(J)
+            return np.asarray(J, float).reshape(neq, neq)
+        if self.jac_sparsity is not None:
+            return sparse_finite_difference_jacobian(
+                self.f, t, u, self.jac_sparsity, self.jac_groups,
+                self.jacobian_increment, self.vectorized)
+        return finite_difference_jacobian(self.f, t, u,
+                                          self.jacobian_increment,
+                                          self.vectorized)
+
+    def newton_matrix(self):
+        """The matrix I - dt * (A x J) of the Newton iteration
+        for the s * neq stage derivatives."""
+        size = self.stages * self.neq
+        if issparse(self.J):
+            return (identity(size, format='csc')
+                    - self.dt * kron(self.a, self.J, format='csc'))
+        return np.eye(size) - self.dt * np.kron(self.a, self.J)
+
+    def newton_solver(self):
+        """Factorize the Newton matrix, and return a function that
+        solves the linear system of each Newton iteration."""
+        return self.factorize(self.newton_matrix())
+
+    def factorize(self, M):
+        """LU factorize M, with scipy.sparse if M is sparse, and
+        return a function that solves M x = b."""
+        if issparse(M):
+            return splu(csc_matrix(M)).solve
+        lu = lu_factor(M, check_finite=False)
+        return lambda b: lu_solve(lu, b, check_finite=False)
 
     def stage_eq(self, k_all):
         a, c = self.a, self.c
         s, neq = self.stages, self.neq
 
-        u, f, n, t = self.u, self.f, self.n, self.t
+        u, n, t = self.u, self.n, self.t
         dt = self.dt
+        u_stages = self.u_stages
 
-        res = np.zeros_like(k_all)
-        k = np.split(k_all, s)
-        for i in range(s):
-            fi = f(t[n] + c[i] * dt, u[n] + dt *
-                   sum([a[i, j] * k[j] for j in range(s)]))
-            res[i * neq:(i + 1) * neq] = k[i] - fi
+        res = np.empty_like(k_all)
+        k = k_all.reshape(s, neq)
+        # u_stages = u[n] + dt * A @ K, with one stage in each row
+        np.dot(a, k, out=u_stages)
+        u_stages *= dt
+        u_stages += u[n]
+        self.stage_rhs(t[n] + c * dt, u_stages, res.reshape(s, neq))
+        np.subtract(k_all, res, out=res)  # res_i = k_i - f_i
 
         return res
 
+    def stage_rhs(self, t, u, out):
+        """Evaluate f at the stage times t and the stage values in
+        the rows of u, and store the results in the rows of out."""
+        if self.batch:
+            self.f_into(t, u.T, out.T)
+        else:
+            for i in range(self.stages):
+                self.f_into(t[i], u[i], out[i])
+
     def advance(self):
         b = self.b
         u, n, t = self.u, self.n, self.t
         dt = self.dt
+        u_new = self.u_new
         k = self.solve_stages()
 
-        return u[n] + dt * sum(b_ * k_ for b_, k_ in zip(b, k))
+        np.dot(b, k, out=u_new)
+        u_new *= dt
+        u_new += u[n]
+        return u_new.reshape(np.shape(u[n]))
 
 
 class BackwardEuler(ImplicitRK):
-    def __init__(self, f):
-        super().__init__(f)
+    def __init__(self, f, newton=True):
+        super().__init__(f, newton)
         self.stages = 1
         self.a = np.array([[1]])
         self.c = np.array([1])
@@ -48,26 +459,81 @@ class BackwardEuler(ImplicitRK):
 
 
 class ImplicitMidpoint(ImplicitRK):
-    def __init__(self, f):
-        super().__init__(f)
+    def __init__(self, f, newton=True):
+        super().__init__(f, newton)
         self.stages = 1
         self.a = np.array([[1 / 2]])
         self.c = np.array([1 / 2])
         self.b = np.array([1])
 
 
-class Radau2(ImplicitRK):
-    def __init__(self, f):
-        super().__init__(f)
+class RadauIIA(ImplicitRK):
+    """
+    Base class for the Radau IIA methods, which solves the linear
+    systems of the Newton iteration in transformed form. With
+    A = T diag(lam) T^-1, the system (I - dt * (A x J)) dk = r is
+    equivalent to the s decoupled systems (I - dt * lam_i * J) w_i
+    = (T^-1 r)_i, with dk = T w. The eigenvalues of A are one real
+    and complex conjugate pairs, and only one system of each pair
+    has to be solved (in complex arithmetic), since w for the other
+    is the complex conjugate. For Radau3 this replaces an LU of size
+    3 * neq with one real and one complex LU of size neq.
+    """
+    transformations = {}  # eigendecomposition of a for each class
+
+    def transformation(self):
+        solver_class = type(self)
+        if solver_class not in RadauIIA.transformations:
+            lam, T = np.linalg.eig(self.a)
+            real = lam.imag == 0
+            T[:, real] = T[:, real].real
+            conjugates = {}
+            for i in np.flatnonzero(lam.imag > 0):
+                j = np.argmin(abs(lam - lam[i].conj()))
+                T[:, j] = T[:, i].conj()
+                conjugates[i] = j
+            solved = np.flatnonzero(lam.imag >= 0)
+            RadauIIA.transformations[solver_class] = (
+                lam, T, np.linalg.inv(T), solved, conjugates, real)
+        return RadauIIA.transformations[solver_class]
+
+    def newton_solver(self):
+        lam, T, T_inv, solved, conjugates, real = self.transformation()
+        J, dt, neq = self.J, self.dt, self.neq
+        if issparse(J):
+            I = identity(neq, format='csc')
+        else:
+            I = np.eye(neq)
+        # the systems of the real eigenvalues are solved in real arithmetic
+        solvers = [self.factorize(I - dt * (lam[i].real if real[i]
+                                            else lam[i]) * J)
+                   for i in solved]
+
+        def solve_linear(r):
+            w = T_inv @ r.reshape(self.stages, neq)
+            for i, solve_i in zip(solved, solvers):
+                if real[i]:
+                    w[i] = solve_i(w[i].real)
+                else:
+                    w[i] = solve_i(w[i])
+                    w[conjugates[i]] = w[i].conj()
+            return (T @ w).real.reshape(-1)
+
+        return solve_linear
+
+
+class Radau2(RadauIIA):
+    def __init__(self, f, newton=True):
+        super().__init__(f, newton)
         self.stages = 2
         self.a = np.array([[5 / 12, -1 / 12], [3 / 4, 1 / 4]])
         self.c = np.array([1 / 3, 1])
         self.b = np.array([3 / 4, 1 / 4])
 
 
-class Radau3(ImplicitRK):
-    def __init__(self, f):
-        super().__init__(f)
+class Radau3(RadauIIA):
+    def __init__(self, f, newton=True):
+        super().__init__(f, newton)
         self.stages = 3
         sq6 = np.sqrt(6)
         self.a = np.array([[(88 - 7 * sq6) / 360,
@@ -82,31 +548,71 @@ class Radau3(ImplicitRK):
 
 
 class SDIRK(ImplicitRK):
+    def allocate_work_arrays(self):
+        super().allocate_work_arrays()
+        self.k = np.zeros((self.stages, self.neq))
+        self.k_sum = np.zeros(self.neq)
+        self.res = np.zeros(self.neq)  # the residual of stage_eq
+
     def stage_eq(self, k, c_i, k_sum):
-        u, f, n, t = self.u, self.f, self.n, self.t
+        u, f_into, n, t = self.u, self.f_into, self.n, self.t
         dt = self.dt
         gamma = self.gamma
+        u_stage, res = self.u_stage, self.res
+
+        # u_stage = u[n] + dt * (k_sum + gamma * k)
+        np.multiply(k, gamma, out=u_stage)
+        u_stage += k_sum
+        u_stage *= dt
+        u_stage += u[n]
+        f_into(t[n] + c_i * dt, u_stage, res)
+        np.subtract(k, res, out=res)
+        return res
 
-        return k - f(t[n] + c_i * dt, u[n] + dt * (k_sum + gamma * k))
+    def newton_matrix(self):
+        """All the stages have the same diagonal gamma, so the
+        matrix I - dt * gamma * J is shared by all the stages
+        of a step, and usually by many steps."""
+        if issparse(self.J):
+            return (identity(self.neq, format='csc')
+                    - self.dt * self.gamma * self.J)
+        return np.eye(self.neq) - self.dt * self.gamma * self.J
+
+    def solve_stage(self, k, c_i, k_sum, retry=None):
+        if self.newton:
+            return self.solve_newton(self.stage_eq, k, args=(c_i, k_sum),
+                                     retry=retry)
+        else:
+            return self.solve_nonlinear(self.stage_eq, k, args=(c_i, k_sum))
 
     def solve_stages(self):
-        u, f, n, t = self.u, self.f, self.n, self.t
+        u, f_into, n, t = self.u, self.f_into, self.n, self.t
         a, c = self.a, self.c
         s = self.stages
+        k_all, k_sum = self.k, self.k_sum
+        k_pred = self.predict_stages()
 
-        k = f(t[n], u[n])  # initial guess for first stage
-        k_sum = np.zeros_like(k)
-        k_all = []
+        if k_pred is None:
+            k = f_into(t[n], u[n], k_all[0])  # initial guess, first stage
         for i in range(s):
-            k_sum = sum(a_ * k_ for a_, k_ in zip(a[i, :i], k_all))
-            k = root(self.stage_eq, k, args=(c[i], k_sum)).x
-            k_all.append(k)
+            np.dot(a[i, :i], k_all[:i], out=k_sum)
+            retry = None
+            if k_pred is not None:
+                k = k_pred[i]
+                # the constant guess, if the iteration fails from k
+                if i == 0:
+                    retry = lambda: self.f(t[n], u[n])
+                else:
+                    retry = lambda: k_all[i - 1]
+            k_all[i] = self.solve_stage(k, c[i], k_sum, retry)
+            k = k_all[i]
+        self.save_stages(k_all)
         return k_all
 
 
 class SDIRK2(SDIRK):
-    def __init__(self, f):
-        super().__init__(f)
+    def __init__(self, f, newton=True):
+        super().__init__(f, newton)
         self.stages = 2
         gamma = (2 - np.sqrt(2)) / 2
         self.gamma = gamma
@@ -117,25 +623,35 @@ class SDIRK2(SDIRK):
 
 
 class ESDIRK(SDIRK):
-    def solve_stages(self):
-        u, f, n, t = self.u, self.f, self.n, self.t
+    def solve_stages(self, start=0):
+        """Compute the stages of the current step. With start=1 the
+        explicit first stage f(t[n], u[n]) is already in self.k[0]."""
+        u, f_into, n, t = self.u, self.f_into, self.n, self.t
         a, c = self.a, self.c
         s = self.stages
+        k_all, k_sum = self.k, self.k_sum
+        k_pred = self.predict_stages()
 
-        k = f(t[n], u[n])  # initial guess for first stage
-        k_sum = np.zeros_like(k)
-        k_all = [k]
+        # explicit first stage, also initial guess for the second
+        if start == 0:
+            f_into(t[n], u[n], k_all[0])
+        k = k_all[0]
         for i in range(1, s):
-            k_sum = sum(a_ * k_ for a_, k_ in zip(a[i, :i], k_all))
-            k = root(self.stage_eq, k, args=(c[i], k_sum)).x
-            k_all.append(k)
+            np.dot(a[i, :i], k_all[:i], out=k_sum)
+            retry = None
+            if k_pred is not None:
+                k = k_pred[i]
+                retry = lambda: k_all[i - 1]  # the constant guess
+            k_all[i] = self.solve_stage(k, c[i], k_sum, retry)
+            k = k_all[i]
+        self.save_stages(k_all)
 
         return k_all
 
 
 class TR_BDF2(ESDIRK):
-    def __init__(self, f):
-        super().__init__(f)
+    def __init__(self, f, newton=True):
+        super().__init__(f, newton)
         self.stages = 3
         gamma = 1 - np.sqrt(2) / 2
         beta = np.sqrt(2) / 4
@@ -147,7 +663,206 @@ class TR_BDF2(ESDIRK):
         self.b = np.array([beta, beta, gamma])
 
 
+def test_simplified_newton():
+    """
+    Solve the stiff Van der Pol equation with the simplified Newton
+    iteration and with scipy.optimize.root, and check that the results
+    agree, while the Jacobian is reused over many steps.
+    """
+    def f(t, u):
+        return [u[1], 10 * (1 - u[0]**2) * u[1] - u[0]]
+
+    N = 200
+    for solver_class in [BackwardEuler, ImplicitMidpoint, Radau2, Radau3,
+                         SDIRK2, TR_BDF2]:
+        results = []
+        for newton in [True, False]:
+            solver = solver_class(f, newton=newton)
+            solver.set_initial_condition([2, 0])
+            t, u = solver.solve((0, 10), N)
+            results.append(u)
+        max_error = abs(results[0] - results[1]).max()
+        msg = f'{solver_class.__name__} failed with max_error={max_error}'
+        assert max_error < 1e-4, msg
+        solver.newton = True
+        solver.solve((0, 10), N)
+        stats = solver.stats
+        assert stats.nsolves >= N and stats.nlu <= stats.njev < N / 2
+        assert stats.nit >= stats.nsolves
+
+
+def test_sparse_jacobian():
+    """
+    Solve Fisher's equation on a chain of cells with and without
+    a declared tridiagonal Jacobian pattern. The sparse finite
+    difference Jacobian should only need three column groups,
+    and give the same solution as the dense one.
+    """
+    class Fisher:
+        def __call__(self, t, u):
+            diffusion = np.zeros_like(u)
+            diffusion[1:-1] = u[:-2] - 2 * u[1:-1] + u[2:]
+            diffusion[0] = u[1] - u[0]
+            diffusion[-1] = u[-2] - u[-1]
+            return 100 * diffusion + u * (1 - u)
+
+    neq = 50
+    u0 = np.exp(-np.linspace(0, 10, neq)**2)
+    model = Fisher()
+    pattern = np.eye(neq) + np.eye(neq, k=1) + np.eye(neq, k=-1)
+    assert group_columns(pattern).max() == 2
+    J = sparse_finite_difference_jacobian(model, 0, u0, pattern,
+                                          group_columns(pattern))
+    assert np.allclose(J.toarray(), finite_difference_jacobian(model, 0, u0))
+
+    for solver_class in [Radau3, TR_BDF2]:
+        results = []
+        for sparsity in [None, pattern]:
+            model.jac_sparsity = sparsity
+            solver = solver_class(model)
+            solver.set_initial_condition(u0)
+            t, u = solver.solve((0, 1), 20)
+            results.append(u)
+        assert issparse(solver.J)
+        assert abs(results[0] - results[1]).max() < 1e-8
+
+
+def test_radau_transformation():
+    """
+    The transformed linear solves of the Radau IIA methods should
+    give the same result as solving with the full Newton matrix,
+    with the system of the real eigenvalue solved in real arithmetic.
+    """
+    rng = np.random.default_rng(1)
+    neq = 5
+    for solver_class in [Radau2, Radau3]:
+        solver = solver_class(lambda t, u: -u)
+        solver.set_initial_condition(np.zeros(neq))
+        solver.dt = 0.1
+        dtypes = []
+        factorize = solver.factorize
+        solver.factorize = lambda M: dtypes.append(M.dtype) or factorize(M)
+        J_sparse = csc_matrix(np.diag(-10 * rng.random(neq)))
+        for J in [rng.normal(size=(neq, neq)), J_sparse]:
+            solver.J = J
+            r = rng.normal(size=solver.stages * neq)
+            M = solver.newton_matrix()
+            if issparse(M):
+                M = M.toarray()
+            dtypes.clear()
+            dk = solver.newton_solver()(r)
+            assert np.allclose(dk, np.linalg.solve(M, r), rtol=1e-12)
+            assert dtypes.count(np.float64) == solver.stages % 2
+
+
+def test_batch_rhs():
+    """
+    Evaluating all the stages in one call to a model declared with
+    batch = True should give the same result with fewer calls.
+    """
+    class ForcedOscillator:
+        def __call__(self, t, u):
+            return [u[1], -u[0] - 0.1 * u[1] + np.cos(t)]
+
+    model = ForcedOscillator()
+    for solver_class in [Radau2, Radau3]:
+        results, nfev = [], []
+        for batch in [False, True]:
+            model.batch = batch
+            solver = solver_class(model)
+            solver.set_initial_condition([1, 0])
+            t, u = solver.solve((0, 10), 50)
+            results.append(u)
+            nfev.append(solver.stats.nfev)
+        assert abs(results[0] - results[1]).max() < 1e-12
+        assert nfev[1] < nfev[0]
+
+
+def test_stage_predictor():
+    """
+    Extrapolating the stages of the previous step should give the
+    same solution as the constant initial guess, in fewer Newton
+    iterations.
+    """
+    def f(t, u):
+        return [u[1], 10 * (1 - u[0]**2) * u[1] - u[0]]
+
+    for solver_class in [Radau2, Radau3, SDIRK2, TR_BDF2]:
+        results, nit = [], []
+        for predictor in ['constant', 'extrapolate']:
+            solver = solver_class(f)
+            solver.predictor = predictor
+            solver.set_initial_condition([2, 0])
+            t, u = solver.solve((0, 10), 200)
+            results.append(u)
+            nit.append(solver.stats.nit)
+        assert abs(results[0] - results[1]).max() < 1e-4
+        assert nit[1] < nit[0]
+
+    # a bad extrapolated guess for the stiff Robertson problem should
+    # be retried from the constant guess
+    def f(t, u):
+        return [-0.04 * u[0] + 1e4 * u[1] * u[2],
+                0.04 * u[0] - 1e4 * u[1] * u[2] - 3e7 * u[1]**2,
+                3e7 * u[1]**2]
+
+    results = []
+    for predictor in ['constant', 'extrapolate']:
+        solver = SDIRK2(f)
+        solver.predictor = predictor
+        solver.set_initial_condition([1, 0, 0])
+        t, u = solver.solve((0, 40), 200)
+        results.append(u[-1])
+    assert abs(results[0] - results[1]).max() < 1e-4
+
+
+def test_jacobian_free_newton():
+    """
+    The Jacobian-free Newton-Krylov iteration should give the same
+    solution of Fisher's equation as the direct Newton iteration,
+    without forming a Jacobian, and a preconditioner with the
+    diffusion part of the Newton matrix should reduce the work.
+    """
+    def f(t, u):
+        diffusion = np.zeros_like(u)
+        diffusion[1:-1] = u[:-2] - 2 * u[1:-1] + u[2:]
+        diffusion[0] = u[1] - u[0]
+        diffusion[-1] = u[-2] - u[-1]
+        return 100 * diffusion + u * (1 - u)
+
+    neq = 50
+    u0 = np.exp(-np.linspace(0, 10, neq)**2)
+    D = 100 * (np.eye(neq, k=1) + np.eye(neq, k=-1) - 2 * np.eye(neq))
+    D[0, 0] = D[-1, -1] = -100
+
+    def diffusion_preconditioner(solver, r):
+        M = np.eye(neq) - solver.dt * solver.gamma * D
+        return np.linalg.solve(M, r)
+
+    for solver_class in [Radau3, SDIRK2, TR_BDF2]:
+        solver = solver_class(f)
+        solver.set_initial_condition(u0)
+        t, u_direct = solver.solve((0, 1), 20)
+        for linear_solver in ['gmres', 'bicgstab']:
+            solver.linear_solver = linear_solver
+            t, u = solver.solve((0, 1), 20)
+            assert solver.J is None
+            assert abs(u - u_direct).max() < 1e-6
+        if solver_class is not Radau3:
+            nfev = solver.stats.nfev
+            solver.preconditioner = diffusion_preconditioner
+            t, u = solver.solve((0, 1), 20)
+            assert abs(u - u_direct).max() < 1e-6
+            assert solver.stats.nfev < nfev
+
+
 if __name__ == "__main__":
     registered_solver_classes.extend(
         [BackwardEuler, ImplicitMidpoint, Radau2, Radau3, SDIRK2, TR_BDF2])
     test_exact_numerical_solution()
+    test_simplified_newton()
+    test_sparse_jacobian()
+    test_radau_transformation()
+    test_batch_rhs()
+    test_stage_predictor()
+    test_jacobian_free_newton()
@@ -21,7 +21,7 @@ class BackwardEuler(ODESolver):
         u, f, n, t = self.u, self.f, self.n, self.t
         k0 = f(t[n], u[n])
         sol = root(self.stage_eq, k0)
-        return sol.x
+        return sol.x.reshape(np.shape(k0))  # root returns k0 as 1D
 
     def advance(self):
         u, f, n, t = self.u, self.f, self.n, self.t
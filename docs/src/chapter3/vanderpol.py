@@ -12,6 +12,20 @@ class VanderPol:
         du1 = self.mu * (1 - u[0]**2) * u[1] - u[0]
         return du0, du1
 
+    def jacobian(self, t, u):
+        mu = self.mu
+        return [[0, 1],
+                [-2 * mu * u[0] * u[1] - 1, mu * (1 - u[0]**2)]]
+
+
+def test_jacobian():
+    """Compare the Jacobian with a finite difference approximation."""
+    model = VanderPol(mu=10)
+    u = [1.5, -2.0]
+    J = model.jacobian(0, u)
+    J_fd = finite_difference_jacobian(model, 0, u)
+    assert np.allclose(J, J_fd, rtol=1e-6)
+
 
 if __name__ == '__main__':
     model = VanderPol(mu=1)
@@ -5,23 +5,56 @@ import numpy as np
 
 class AdaptiveESDIRK(AdaptiveODESolver, ESDIRK):
 
+    def allocate_work_arrays(self):
+        super().allocate_work_arrays()
+        self.error = np.zeros(self.neq)
+        # in a stiffly accurate method (like TR-BDF2) the last stage
+        # is f at the end of the step, and the first of the next step
+        a, b, c = self.a, self.b, self.c
+        self.fsal = c[-1] == 1 and np.array_equal(a[-1], b)
+        self.t_end = None  # the end point of the last step, if fsal
+        self.t_first = None  # the time point of the first stage in k[0]
+
+    def initial_step_size(self, t0, T):
+        # f(t0, u0) is the first stage of the first step
+        dt = super().initial_step_size(t0, T, self.k[0])
+        self.t_first = t0
+        return dt
+
     def advance(self):
         b = self.b
         e = self.e
-        u = self.u
+        u, n, t = self.u, self.n, self.t
         dt = self.dt
-        k = self.solve_stages()
-        u_step = dt * sum(b_ * k_ for b_, k_ in zip(b, k))
-        error = dt * sum(e_ * k_ for e_, k_ in zip(e, k))
+        u_new, error = self.u_new, self.error
+        if self.t_end == t[n] and self.t_first != t[n]:
+            self.k[0] = self.k[-1]  # the last step was accepted
+            self.t_first = t[n]
+        # after a rejected step, k[0] is still f(t[n], u[n])
+        start = 1 if self.t_first == t[n] else 0
+        k = self.solve_stages(start)
+        self.t_first = t[n]
+        self.t_end = t[n] + dt if self.fsal else None
+
+        np.dot(b, k, out=u_new)
+        u_new *= dt
+        u_new += u[n]
+        np.dot(e, k, out=error)
+        error *= dt
+        return u_new, self.error_norm(error, u_new)
 
-        u_new = u[-1] + u_step
-        error_norm = np.linalg.norm(error)
-        return u_new, error_norm
+    def step_derivatives(self):
+        # The first stage is f(t[n - 1], u[n - 1]), and when the method
+        # is stiffly accurate (like TR-BDF2), the last is f(t[n], u[n])
+        if self.fsal:
+            return self.k[0], self.k[-1]
+        return super().step_derivatives()
 
 
 class TR_BDF2_Adaptive(AdaptiveESDIRK):
-    def __init__(self, f, eta=0.9):
+    def __init__(self, f, eta=0.9, newton=True):
         super().__init__(f, eta)  # calls AdaptiveODESolver.__init__
+        self.newton = newton
         self.stages = 3
         self.order = 2
         gamma = 1 - np.sqrt(2) / 2
@@ -36,6 +69,51 @@ class TR_BDF2_Adaptive(AdaptiveESDIRK):
         self.e = self.b - bh
 
 
+def test_dense_output():
+    """
+    The Hermite interpolation at t_eval should be about as
+    accurate as the solution at the time steps.
+    """
+    def f(t, u):
+        return [u[1], -u[0]]
+
+    t_eval = np.linspace(0, 10, 101)
+    solver = TR_BDF2_Adaptive(f)
+    solver.set_initial_condition([1, 0])
+    t, u = solver.solve((0, 10), tol=1e-5)
+    step_error = abs(u[:, 0] - np.cos(t)).max()
+    t, u = solver.solve((0, 10), tol=1e-5, t_eval=t_eval)
+    assert abs(u[:, 0] - np.cos(t_eval)).max() < 2 * step_error
+
+
+def test_first_stage_reuse():
+    """
+    The explicit first stage should only be evaluated once, by the
+    initial step size, since it is kept after a rejected step, and
+    TR-BDF2 is stiffly accurate, so that the last stage of an accepted
+    step is the first of the next. The model has a Jacobian, so that
+    f is only evaluated for the stages and the initial step size.
+    """
+    calls = []
+
+    class VanDerPol:
+        def __call__(self, t, u):
+            calls.append((t, tuple(u)))
+            return [u[1], 10 * (1 - u[0]**2) * u[1] - u[0]]
+
+        def jacobian(self, t, u):
+            return [[0, 1], [-20 * u[0] * u[1] - 1, 10 * (1 - u[0]**2)]]
+
+    solver = TR_BDF2_Adaptive(VanDerPol())
+    solver.set_initial_condition([2, 0])
+    t, u = solver.solve((0, 10), tol=1e-5)
+    assert solver.fsal and solver.stats.nreject > 0
+    first_stages = [(t_n, tuple(u_n)) for t_n, u_n in zip(t[:-1], u[:-1])]
+    assert calls.count(first_stages[0]) == 1
+    for call in first_stages[1:]:
+        assert call not in calls, f'f{call} evaluated again'
+
+
 if __name__ == '__main__':
     from hodgkinhuxley import HodgkinHuxley
     import matplotlib.pyplot as plt
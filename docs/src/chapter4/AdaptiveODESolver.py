@@ -2,131 +2,645 @@ from ODESolver import *
 from math import isnan, isinf
 
 
+class StepSizeController:
+    """
+    Step size controller of the digital filter form of Soderlind
+    (2003). After an accepted step n with error estimate err_n,
+    the step size is multiplied by
+
+        eta * prod_j (tol / err_{n-j})**(beta[j] / k)
+            * prod_j (dt_{n-j} / dt_{n-j-1})**(-alpha[j])
+
+    where k = p + 1 for an error estimate of order p, and limited
+    to [min_factor, max_factor]. With the default beta = (1,) this
+    is the elementary controller. The filters use the errors and
+    step sizes of the previous accepted steps, and the elementary
+    controller is used until there are enough of them, and after
+    rejected steps, where the step size is not allowed to grow.
+    """
+
+    def __init__(self, beta=(1,), alpha=(), eta=0.9, min_factor=0,
+                 max_factor=np.inf):
+        self.beta = beta
+        self.alpha = alpha
+        self.eta = eta
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.reset()
+
+    def reset(self):
+        """Forget the steps of a previous solve."""
+        self.ratios = []  # tol / err of the last accepted steps, newest first
+        self.dts = []     # and their step sizes
+
+    def step_factor(self, dt, ratio, k, accepted=True):
+        """The factor to multiply the step size dt with, after a step
+        with ratio = tol / err and an error estimate of order k - 1.
+        A zero error (ratio = inf) gives the largest allowed factor."""
+        if ratio == np.inf:
+            self.reset()  # the filters cannot use an infinite ratio
+            return self.max_factor if accepted else 1
+        if not accepted:
+            factor = self.eta * ratio**(1 / k)
+            return min(max(factor, self.min_factor), 1)
+
+        self.ratios.insert(0, ratio)
+        self.dts.insert(0, dt)
+        del self.ratios[len(self.beta):], self.dts[len(self.alpha) + 1:]
+        if (len(self.ratios) < len(self.beta)
+                or len(self.dts) < len(self.alpha) + 1):
+            factor = self.eta * ratio**(1 / k)
+        else:
+            factor = self.eta
+            for beta_j, ratio_j in zip(self.beta, self.ratios):
+                factor *= ratio_j**(beta_j / k)
+            for alpha_j, dt_j, dt_old in zip(self.alpha, self.dts,
+                                             self.dts[1:]):
+                factor *= (dt_j / dt_old)**(-alpha_j)
+        return min(max(factor, self.min_factor), self.max_factor)
+
+
+class PIController(StepSizeController):
+    """The PI controller of Gustafsson, as in the codes of
+    Hairer and Wanner, which damps the oscillations of the step
+    size that the elementary controller gives at the stability
+    limit of explicit methods."""
+
+    def __init__(self, eta=0.9, min_factor=0.2, max_factor=5):
+        super().__init__((0.7, -0.4), (), eta, min_factor, max_factor)
+
+
+class H211bController(StepSizeController):
+    """Soderlind's H211b controller, a low-pass filter of the
+    errors and step size ratios, which gives smooth step size
+    sequences. b = 4 is the recommended value."""
+
+    def __init__(self, b=4, eta=0.9, min_factor=0.2, max_factor=5):
+        super().__init__((1 / b, 1 / b), (1 / b,), eta, min_factor,
+                         max_factor)
+
+
+class PIDController(StepSizeController):
+    """Soderlind's H312PID controller, which filters the errors
+    of the last three steps."""
+
+    def __init__(self, eta=0.9, min_factor=0.2, max_factor=5):
+        super().__init__((1 / 18, 1 / 9, 1 / 18), (), eta, min_factor,
+                         max_factor)
+
+
 class AdaptiveODESolver(ODESolver):
     def __init__(self, f, eta=0.9):
+        """
+        The step size is chosen by self.controller, which is the
+        elementary controller with safety factor eta by default,
+        and can be replaced by another StepSizeController, e.g.
+        solver.controller = PIController().
+        """
         super().__init__(f)
-        self.eta = eta
+        self.controller = StepSizeController(eta=eta)
+        self.initial_capacity = 1024  # time points in self.t and self.u
 
-    def new_step_size(self, dt, loc_error):
-        eta = self.eta
-        tol = self.tol
-        p = self.order
+    def new_step_size(self, dt, loc_error, accepted=True):
         if isnan(loc_error) or isinf(loc_error):
             return self.min_dt
 
-        new_dt = eta * (tol / loc_error)**(1 / (p + 1)) * dt
-        new_dt = max(new_dt, self.min_dt)
+        ratio = self.tol / loc_error if loc_error > 0 else np.inf
+        factor = self.controller.step_factor(dt, ratio, self.order + 1,
+                                             accepted)
+        new_dt = max(factor * dt, self.min_dt)
         return min(new_dt, self.max_dt)
 
-    def solve(self, t_span, tol=1e-3, max_dt=np.inf, min_dt=1e-5):
+    def solve(self, t_span, tol=1e-3, max_dt=np.inf, min_dt=1e-5,
+              save_every=1, components=None, final_only=False,
+              filename=None, rtol=None, atol=None, t_eval=None):
         """Compute solution for t_span[0] <= t <= t_span[1],
-        using N steps."""
+        with the time step adapted to the tolerance tol.
+        The output can be reduced with save_every, components and
+        final_only, or written to a .npy file with filename, as in
+        ODESolver.solve. Here save_every counts accepted steps, and
+        the file grows as the steps are accepted.
+
+        By default the 2-norm of the local error estimate is kept
+        below tol. If rtol or atol is given (as a number, or an
+        array with one value per component), tol is not used, and
+        the error is instead measured in the weighted RMS norm
+
+            sqrt(mean((error / (atol + rtol * |u|))**2))
+
+        where |u| is the largest of |u[n]| and |u[n + 1]| in each
+        component, and kept below 1. This suits systems where the
+        components have very different magnitudes. The defaults are
+        rtol = 1e-3 and atol = 1e-6, as in solve_ivp.
+
+        With t_eval, a sorted array of times in t_span, the solution
+        is returned at these times instead of at the time steps,
+        see solve_dense."""
+        if t_eval is not None:
+            if (save_every != 1 or components is not None or final_only
+                    or filename is not None):
+                raise ValueError('t_eval cannot be combined with the '
+                                 'other output options')
+            return self.solve_dense(t_span, t_eval, tol, max_dt, min_dt,
+                                    rtol, atol)
+        if (save_every != 1 or components is not None or final_only
+                or filename is not None):
+            chunks = self.solve_iter(t_span, tol, max_dt, min_dt,
+                                     rtol=rtol, atol=atol)
+            return self.collect_output(chunks, save_every, components,
+                                       final_only, filename)
+
+        # With an infinite chunk size, the whole solution is one chunk
+        chunks = self.solve_iter(t_span, tol, max_dt, min_dt,
+                                 chunk_size=np.inf, rtol=rtol, atol=atol)
+        return next(chunks)
+
+    def solve_iter(self, t_span, tol=1e-3, max_dt=np.inf, min_dt=1e-5,
+                   chunk_size=1000, rtol=None, atol=None):
+        """Generator version of solve, which yields the solution
+        as (t, u) chunks of chunk_size accepted time steps (the last
+        chunk may be shorter). The first chunk also contains the
+        initial condition. Only the current chunk is stored.
+
+        The time points are stored in the arrays self.t and self.u,
+        which are allocated with room for a number of time points,
+        and doubled in size when they are full (see grow_buffers).
+        The chunks are views of these arrays, so with an infinite
+        chunk_size the solution is returned without copying it."""
         t0, T = t_span
         self.tol = tol
+        self.rtol = rtol
+        self.atol = atol
+        if rtol is not None or atol is not None:
+            self.rtol = 1e-3 if rtol is None else np.asarray(rtol, float)
+            self.atol = 1e-6 if atol is None else np.asarray(atol, float)
+            self.tol = 1.0  # the weighted error norm is relative to 1
         self.min_dt = min_dt
         self.max_dt = max_dt
-        self.t = [t0]
+        max_capacity = chunk_size + 1
+        capacity = int(min(max_capacity, self.initial_capacity))
 
         if self.neq == 1:
-            self.u = [np.asarray(self.u0).reshape(1)]
+            u0 = np.asarray(self.u0).reshape(1)
         else:
-            self.u = [self.u0]
-
-        self.n = 0
-        self.dt = 0.1 / np.linalg.norm(self.f(t0, self.u0))
+            u0 = self.u0
+        self.new_buffers(t0, u0, capacity)
+        self.controller.reset()
+        self.start_stats()
+        self.allocate_work_arrays()
+        self.dt = self.initial_step_size(t0, T)
 
+        first = 0  # index of the first point to yield
         loc_t = t0
         while loc_t < T:
             u_new, loc_error = self.advance()
-            if loc_error < tol or self.dt < self.min_dt:
+            if loc_error < self.tol or self.dt < self.min_dt:
                 loc_t += self.dt
-                self.t.append(loc_t)
-                self.u.append(u_new)
+                n = self.n + 1
+                if n == len(self.t):
+                    self.grow_buffers(max_capacity)
+                self.t[n] = loc_t
+                self.u[n] = u_new  # u_new may be a work array
                 self.dt = self.new_step_size(self.dt, loc_error)
                 self.dt = min(self.dt, T - loc_t, max_dt)
-                self.n += 1
+                self.n = n
+                self.stats.naccept += 1
+                if n + 1 > chunk_size:
+                    yield self.t[first:n + 1], self.u[first:n + 1]
+                    # continue from the last point, in new arrays, so
+                    # that the chunk yielded is not overwritten
+                    self.new_buffers(self.t[n], self.u[n], capacity)
+                    first = 1
             else:
-                self.dt = self.new_step_size(self.dt, loc_error)
-        return np.array(self.t), np.array(self.u)
+                self.dt = self.new_step_size(self.dt, loc_error,
+                                             accepted=False)
+                self.stats.nreject += 1
+        self.finish_stats()
+        if self.n + 1 > first:
+            yield self.t[first:self.n + 1], self.u[first:self.n + 1]
 
+    def solve_dense(self, t_span, t_eval, tol=1e-3, max_dt=np.inf,
+                    min_dt=1e-5, rtol=None, atol=None):
+        """Solve as solve, but return the solution at the times in
+        t_eval, computed with interpolate in each step as the steps
+        are accepted. The steps are not limited by t_eval, and only
+        the current step is stored."""
+        t_eval = np.asarray(t_eval, float)
+        t0, T = t_span
+        if (np.any(np.diff(t_eval) < 0) or t_eval[0] < t0
+                or t_eval[-1] > T):
+            raise ValueError('t_eval must be sorted and within t_span')
+        u_eval = None
+        i = 0  # the first time point in t_eval not computed yet
+        # chunks of one step, from t[0] to t[1]
+        for t, u in self.solve_iter(t_span, tol, max_dt, min_dt,
+                                    chunk_size=1, rtol=rtol, atol=atol):
+            if u_eval is None:
+                u_eval = np.zeros((len(t_eval),) + np.shape(u[-1]))
+            j = np.searchsorted(t_eval, self.t[self.n], side='right')
+            if j > i:
+                u_eval[i:j] = self.interpolate(t_eval[i:j])
+                i = j
+        return t_eval, u_eval
 
-class EulerHeun(AdaptiveODESolver):
-    def __init__(self, f, eta=0.9):
-        super().__init__(f, eta)
-        self.order = 1
+    def interpolate(self, t_out):
+        """
+        The solution at the times t_out in the last accepted step,
+        t[n - 1] <= t_out <= t[n], from the cubic Hermite polynomial
+        with the values and derivatives at the ends of the step.
+        The error is O(dt**4), so the interpolation keeps the global
+        order of methods up to order 4.
+        """
+        t, u, n = self.t, self.u, self.n
+        dt = t[n] - t[n - 1]
+        f_old, f_new = self.step_derivatives()
+        theta = ((np.asarray(t_out) - t[n - 1]) / dt)[:, None]
+        du = u[n] - u[n - 1]
+        return (u[n - 1] + theta * du + theta * (theta - 1)
+                * ((1 - 2 * theta) * du + (theta - 1) * dt * f_old
+                   + theta * dt * f_new))
+
+    def step_derivatives(self):
+        """f at the start and the end of the last accepted step,
+        for the Hermite interpolation."""
+        t, u, n = self.t, self.u, self.n
+        return self.f(t[n - 1], u[n - 1]), self.f(t[n], u[n])
+
+    def initial_step_size(self, t0, T, f0=None):
+        """
+        Estimate the size of the first step from t0 towards T, with
+        the algorithm of Hairer, Norsett and Wanner (also used by
+        solve_ivp). A step of 1% of |u| / |f| in the error norm is
+        used to estimate the second derivative of u, which gives the
+        step where the error of a method of the given order is about
+        1% of the tolerance. This needs two evaluations of f, and
+        f(t0, u0) is stored in the array f0 if one is given.
+        """
+        u0 = self.u[0]
+        if f0 is None:
+            f0 = np.zeros(np.shape(u0))
+        self.f_into(t0, u0, f0)
+
+        def norm(x):  # relative to the tolerance
+            return self.error_norm(x, u0) / self.tol
+
+        d0, d1 = norm(u0), norm(f0)
+        if d0 < 1e-5 or d1 < 1e-5:
+            dt0 = 1e-6
+        else:
+            dt0 = 0.01 * d0 / d1
+        dt0 = min(dt0, T - t0)
+        f1 = self.f(t0 + dt0, u0 + dt0 * f0)
+        d2 = norm(f1 - f0) / dt0
+        if max(d1, d2) <= 1e-15:
+            dt1 = max(1e-6, dt0 * 1e-3)
+        else:
+            dt1 = (0.01 / max(d1, d2))**(1 / (self.order + 1))
+        return min(100 * dt0, dt1, T - t0, self.max_dt)
+
+    def error_norm(self, error, u_new):
+        """The norm of the local error estimate of the step from
+        u[n] to u_new, which the step size control compares to
+        self.tol, see solve."""
+        if self.rtol is None:
+            return np.linalg.norm(error)
+        scale = np.maximum(np.abs(self.u[self.n]), np.abs(u_new))
+        scale *= self.rtol
+        scale += self.atol
+        return np.sqrt(np.mean((error / scale)**2))
+
+    def state_shape(self):
+        # a scalar ODE is stored as a system of one equation
+        return super().state_shape() or (1,)
+
+    def new_buffers(self, t0, u0, capacity):
+        """Allocate self.t and self.u with room for capacity
+        time points, and store (t0, u0) as the first point."""
+        self.t = np.zeros(capacity)
+        self.u = np.zeros((capacity,) + np.shape(u0))
+        self.t[0] = t0
+        self.u[0] = u0
+        self.n = 0
+
+    def grow_buffers(self, max_capacity=np.inf):
+        """Double the capacity of self.t and self.u (up to
+        max_capacity), keeping the n + 1 points stored. The
+        doubling makes the cost of the copying O(1) per step."""
+        n = self.n
+        capacity = int(min(2 * len(self.t), max_capacity))
+        t, u = self.t, self.u
+        self.t = np.zeros(capacity)
+        self.u = np.zeros((capacity,) + u.shape[1:])
+        self.t[:n + 1] = t[:n + 1]
+        self.u[:n + 1] = u[:n + 1]
+
+
+class AdaptiveExplicitRK(AdaptiveODESolver, ExplicitRK):
+    """
+    Explicit Runge-Kutta pair defined by a Butcher tableau. The
+    solution is advanced with the weights b, and the error is
+    estimated with the weights e, which are the difference between
+    the weights of the two methods in the pair.
+
+    The first stage f(t[n], u[n]) does not depend on dt, so it is
+    kept when a step is rejected. If the last stage is evaluated
+    at the new solution (first same as last, FSAL), it is also
+    used as the first stage of the next step once it is accepted,
+    and so is f(t[n], u[n]) if it is computed for dense output.
+
+    Pairs with a continuous extension set the matrix P, with the
+    weights b(theta) = P @ [theta, theta**2, ...] of the solution
+    at t[n] + theta * dt. Others use Hermite interpolation.
+    """
+
+    def allocate_work_arrays(self):
+        super().allocate_work_arrays()
+        self.error = np.zeros(np.size(self.u0))
+        a, b, c = self.a, self.b, self.c
+        self.fsal = (c[-1] == 1 and b[-1] == 0
+                     and np.array_equal(a[-1, :-1], b[:-1]))
+        # f at the end of the last step, and the time point of it
+        if self.fsal:
+            self.f_end = self.k[-1]
+        else:
+            self.f_end = np.zeros(np.size(self.u0))
+        self.t_end = None
+        self.t_first = None  # the time point of the first stage in k[0]
+
+    def initial_step_size(self, t0, T):
+        # f(t0, u0) is the first stage of the first step
+        dt = super().initial_step_size(t0, T, self.k[0])
+        self.t_first = t0
+        return dt
 
     def advance(self):
-        u, f, t = self.u, self.f, self.t
+        b, e = self.b, self.e
+        u, n, t = self.u, self.n, self.t
         dt = self.dt
-        k1 = f(t[-1], u[-1])
-        k2 = f(t[-1] + dt, u[-1] + dt * k1)
-        high = dt / 2 * (k1 + k2)
-        low = dt * k1
+        u_new, error = self.u_new, self.error
+        k = self.k
+        if self.t_end == t[n] and self.t_first != t[n]:
+            k[0] = self.f_end  # the last step was accepted
+            self.t_first = t[n]
+        start = 1 if self.t_first == t[n] else 0
+        k = self.compute_stages(t[n], u[n], start)
+        self.t_first = t[n]
+        self.t_end = t[n] + dt if self.fsal else None
+
+        np.dot(b, k, out=u_new)
+        u_new *= dt
+        u_new += u[n]
+        np.dot(e, k, out=error)
+        error *= dt
+        return u_new, self.error_norm(error, u_new)
+
+    def step_derivatives(self):
+        t, u, n = self.t, self.u, self.n
+        if self.t_end != t[n]:
+            self.f_into(t[n], u[n], self.f_end)
+            self.t_end = t[n]
+        return self.k[0], self.f_end
+
+    def interpolate(self, t_out):
+        if not hasattr(self, 'P'):
+            return super().interpolate(t_out)
+        t, u, n = self.t, self.u, self.n
+        dt = t[n] - t[n - 1]
+        theta = (np.asarray(t_out) - t[n - 1]) / dt
+        powers = theta[:, None]**np.arange(1, self.P.shape[1] + 1)
+        return u[n - 1] + dt * (powers @ self.P.T) @ self.k
 
-        unew = u[-1] + low
-        error = np.linalg.norm(high - low)
-        return unew, error
 
+class EulerHeun(AdaptiveExplicitRK):
+    def __init__(self, f, eta=0.9):
+        super().__init__(f, eta)
+        self.order = 1
+        self.stages = 2
+        self.a = np.array([[0, 0],
+                           [1, 0]])
+        self.c = np.array([0, 1])
+        self.b = np.array([1, 0])          # Forward Euler
+        bh = np.array([1 / 2, 1 / 2])      # Heun
+        self.e = bh - self.b
 
-class RKF45(AdaptiveODESolver):
+
+class RKF45(AdaptiveExplicitRK):
     def __init__(self, f, eta=0.9):
         super().__init__(f, eta)
         self.order = 4
+        self.stages = 6
+        self.a = np.array([
+            [0, 0, 0, 0, 0, 0],
+            [1 / 4, 0, 0, 0, 0, 0],
+            [3 / 32, 9 / 32, 0, 0, 0, 0],
+            [1932 / 2197, -7200 / 2197, 7296 / 2197, 0, 0, 0],
+            [439 / 216, -8, 3680 / 513, -845 / 4104, 0, 0],
+            [-8 / 27, 2, -3544 / 2565, 1859 / 4104, -11 / 40, 0]])
+        self.c = np.array([0, 1 / 4, 3 / 8, 12 / 13, 1, 1 / 2])
+        self.b = np.array([25 / 216, 0, 1408 / 2565,
+                           2197 / 4104, -1 / 5, 0])
+        bh = np.array([16 / 135, 0, 6656 / 12825,
+                       28561 / 56430, -9 / 50, 2 / 55])
+        self.e = bh - self.b
 
-    def advance(self):
-        u, f, t = self.u, self.f, self.t
-        dt = self.dt
-        c2 = 1 / 4
-        a21 = 1 / 4
-        c3 = 3 / 8
-        a31 = 3 / 32
-        a32 = 9 / 32
-        c4 = 12 / 13
-        a41 = 1932 / 2197
-        a42 = -7200 / 2197
-        a43 = 7296 / 2197
-        c5 = 1
-        a51 = 439 / 216
-        a52 = -8
-        a53 = 3680 / 513
-        a54 = -845 / 4104
-        c6 = 1 / 2
-        a61 = -8 / 27
-        a62 = 2
-        a63 = -3544 / 2565
-        a64 = 1859 / 4104
-        a65 = -11 / 40
-        b1 = 25 / 216
-        b2 = 0
-        b3 = 1408 / 2565
-        b4 = 2197 / 4104
-        b5 = -1 / 5
-        b6 = 0
-        bh1 = 16 / 135
-        bh2 = 0
-        bh3 = 6656 / 12825
-        bh4 = 28561 / 56430
-        bh5 = -9 / 50
-        bh6 = 2 / 55
-
-        k1 = f(t[-1], u[-1])
-        k2 = f(t[-1] + c2 * dt, u[-1] + dt * (a21 * k1))
-        k3 = f(t[-1] + c3 * dt, u[-1] + dt * (a31 * k1 + a32 * k2))
-        k4 = f(t[-1] + c4 * dt, u[-1] + dt * (a41 * k1 + a42 * k2 + a43 * k3))
-        k5 = f(t[-1] + c5 * dt, u[-1] + dt *
-               (a51 * k1 + a52 * k2 + a53 * k3 + a54 * k4))
-        k6 = f(t[-1] + c6 * dt, u[-1] +
-               dt * (a61 * k1 + a62 * k2 + a63 * k3 
-                     + a64 * k4 + a65 * k5))
-
-        low = dt * (b1 * k1 + b3 * k3 + b4 * k4 + b5 * k5)
-        high = dt * (bh1 * k1 + bh3 * k3 + bh4 * k4 
-                     + bh5 * k5 + bh6 * k6)
-
-        unew = u[-1] + low
-        error = np.linalg.norm(high - low)
-
-        return unew, error
+
+class DormandPrince54(AdaptiveExplicitRK):
+    """
+    The 5(4) pair of Dormand and Prince, used in solve_ivp (RK45)
+    and MATLAB's ode45. The solution is advanced with the fifth
+    order method, and the last stage is evaluated at the new
+    solution (FSAL), so an accepted step needs six evaluations of f.
+    The dense output is the fourth order one of Shampine (1986).
+    """
+
+    def __init__(self, f, eta=0.9):
+        super().__init__(f, eta)
+        self.order = 4  # of the error estimate, for the step size
+        self.stages = 7
+        self.a = np.array([
+            [0, 0, 0, 0, 0, 0, 0],
+            [1 / 5, 0, 0, 0, 0, 0, 0],
+            [3 / 40, 9 / 40, 0, 0, 0, 0, 0],
+            [44 / 45, -56 / 15, 32 / 9, 0, 0, 0, 0],
+            [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729, 0, 0, 0],
+            [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176,
+             -5103 / 18656, 0, 0],
+            [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0]])
+        self.c = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1])
+        self.b = np.array([35 / 384, 0, 500 / 1113, 125 / 192,
+                           -2187 / 6784, 11 / 84, 0])
+        bh = np.array([5179 / 57600, 0, 7571 / 16695, 393 / 640,
+                       -92097 / 339200, 187 / 2100, 1 / 40])
+        self.e = self.b - bh
+        self.P = np.array([
+            [1, -8048581381 / 2820520608, 8663915743 / 2820520608,
+             -12715105075 / 11282082432],
+            [0, 0, 0, 0],
+            [0, 131558114200 / 32700410799, -68118460800 / 10900136933,
+             87487479700 / 32700410799],
+            [0, -1754552775 / 470086768, 14199869525 / 1410260304,
+             -10690763975 / 1880347072],
+            [0, 127303824393 / 49829197408, -318862633887 / 49829197408,
+             701980252875 / 199316789632],
+            [0, -282668133 / 205662961, 2019193451 / 616988883,
+             -1453857185 / 822651844],
+            [0, 40617522 / 29380423, -110615467 / 29380423,
+             69997945 / 29380423]])
+
+
+def test_solve_iter():
+    """
+    Check that the chunks from solve_iter add up to
+    the same solution as solve.
+    """
+    def f(t, u):
+        return [u[1], -u[0]]
+
+    for solver_class in [EulerHeun, RKF45, DormandPrince54]:
+        solver = solver_class(f)
+        solver.set_initial_condition([1, 0])
+        t, u = solver.solve((0, 10), tol=1e-4)
+        chunks = list(solver.solve_iter((0, 10), tol=1e-4, chunk_size=7))
+        assert all(len(t_) == 7 for t_, u_ in chunks[1:-1])
+        t_iter = np.concatenate([t_ for t_, u_ in chunks])
+        u_iter = np.concatenate([u_ for t_, u_ in chunks])
+        msg = f'{solver_class.__name__} failed'
+        assert np.array_equal(t, t_iter) and np.array_equal(u, u_iter), msg
+
+
+def test_grow_buffers():
+    """
+    Starting with room for only a few time points, the buffers
+    should be doubled as needed, and give the same solution, which
+    is returned as views of the buffers.
+    """
+    def f(t, u):
+        return [u[1], -u[0]]
+
+    solver = RKF45(f)
+    solver.set_initial_condition([1, 0])
+    t, u = solver.solve((0, 10), tol=1e-6)
+    solver.initial_capacity = 3
+    t_grown, u_grown = solver.solve((0, 10), tol=1e-6)
+    assert np.array_equal(t, t_grown) and np.array_equal(u, u_grown)
+    assert len(t) <= len(solver.t) < 2 * len(t)
+    assert u_grown.base is solver.u
+
+
+def test_first_stage_reuse():
+    """
+    The first stage should only be evaluated after an accepted
+    step, and with the FSAL methods, only in the first step.
+    The first two evaluations of f are for the initial step size,
+    and the first one is also the first stage of the first step.
+    """
+    def f(t, u):
+        return [u[1], 5 * (1 - u[0]**2) * u[1] - u[0]]
+
+    for solver_class, stages in [(RKF45, 6), (EulerHeun, 2),
+                                 (DormandPrince54, 7)]:
+        solver = solver_class(f)
+        solver.set_initial_condition([2, 0])
+        t, u = solver.solve((0, 20), tol=1e-4)
+        stats = solver.stats
+        attempts = stats.naccept + stats.nreject
+        if solver.fsal:
+            expected = 2 + (stages - 1) * attempts
+        else:
+            expected = 2 + stages * attempts - stats.nreject - 1
+        msg = f'{solver_class.__name__} failed with nfev={stats.nfev}'
+        assert stats.nfev == expected, msg
+
+
+def test_step_size_controllers():
+    """
+    The filtering controllers should reject fewer steps than the
+    elementary one on the Van der Pol equation, with the same
+    accuracy, and keep the step size changes within the limits.
+    """
+    def f(t, u):
+        return [u[1], 5 * (1 - u[0]**2) * u[1] - u[0]]
+
+    solver = RKF45(f)
+    solver.set_initial_condition([2, 0])
+    t, u_ref = solver.solve((0, 20), tol=1e-4)
+    rate = solver.stats.rejection_rate()
+    for controller in [PIController(), H211bController(), PIDController()]:
+        solver.controller = controller
+        t, u = solver.solve((0, 20), tol=1e-4)
+        msg = f'{type(controller).__name__} failed'
+        assert solver.stats.rejection_rate() < rate, msg
+        assert abs(u[-1] - u_ref[-1]).max() < 1e-3, msg
+        ratios = np.diff(t)[1:-1] / np.diff(t)[:-2]
+        assert ratios.max() <= 5 + 1e-12, msg
+
+
+def test_weighted_error_norm():
+    """
+    With rtol, a small and fast decaying component should be
+    solved accurately, while a tol on the unscaled norm only
+    controls the large component.
+    """
+    def f(t, u):
+        return [-u[0], -10 * u[1]]
+
+    u0 = [1e6, 1]
+    u_exact = np.array(u0) * np.exp([-2, -20])
+    solver = RKF45(f)
+    solver.set_initial_condition(u0)
+    t, u = solver.solve((0, 2), tol=1e-2)
+    rel_error = abs(u[-1] - u_exact) / u_exact
+    assert rel_error[1] > 0.1
+    t, u = solver.solve((0, 2), rtol=1e-6, atol=[1e-3, 1e-12])
+    rel_error = abs(u[-1] - u_exact) / u_exact
+    assert rel_error.max() < 1e-2
+
+
+def test_initial_step_size():
+    """
+    The first step should be accepted, also when f(t0, u0) = 0,
+    and the estimate should follow the tolerance.
+    """
+    def f(t, u):
+        return [u[1], -u[0]]
+
+    def g(t, u):
+        return np.sin(t)
+
+    for solver_class in [EulerHeun, RKF45, DormandPrince54]:
+        dt = []
+        for tol in [1e-4, 1e-8]:
+            for rhs, u0 in [(g, 0), (f, [1, 0])]:
+                solver = solver_class(rhs)
+                solver.set_initial_condition(u0)
+                chunks = solver.solve_iter((0, 10), tol, chunk_size=1)
+                t, u = next(chunks)
+                msg = f'{solver_class.__name__} failed'
+                assert solver.stats.nreject == 0 and t[1] > 0, msg
+            dt.append(t[1])
+        assert dt[1] < dt[0]
+
+
+def test_dense_output():
+    """
+    The solution at t_eval should be about as accurate as at the
+    time steps, without changing the steps.
+    """
+    def f(t, u):
+        return [u[1], -u[0]]
+
+    t_eval = np.linspace(0, 10, 101)
+    for solver_class in [EulerHeun, RKF45, DormandPrince54]:
+        solver = solver_class(f)
+        solver.set_initial_condition([1, 0])
+        for tol in [1e-4, 1e-7]:
+            t, u = solver.solve((0, 10), tol)
+            step_error = abs(u[:, 0] - np.cos(t)).max()
+            t_, u_eval = solver.solve((0, 10), tol, t_eval=t_eval)
+            assert solver.stats.naccept == len(t) - 1
+            error = abs(u_eval[:, 0] - np.cos(t_eval)).max()
+            msg = f'{solver_class.__name__} failed with error={error}'
+            assert error < 2 * step_error, msg
 
 
 if __name__ == '__main__':
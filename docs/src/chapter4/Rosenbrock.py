@@ -0,0 +1,258 @@
+from ImplicitRK import *
+from AdaptiveODESolver import *
+
+
+class Rosenbrock(ImplicitRK):
+    """
+    Base class for the Rosenbrock (linearly implicit) methods. Each
+    step solves the s linear systems
+
+        (I - dt * gamma * J) k_i = dt * f(t + alpha_i * dt,
+                                          u + sum_j alpha_ij * k_j)
+            + dt * J @ sum_j gamma_ij * k_j + dt**2 * gamma_i * f_t
+
+    with one Jacobian and one LU factorization per step, and no
+    Newton iteration. The methods are defined by the lower triangular
+    matrices alpha and Gamma (with gamma on the diagonal), and the
+    weights b (and bh of the embedded method for the adaptive ones).
+    As in the codes of Hairer and Wanner, the stages are computed in
+    the variables U = Gamma @ k, which avoids products with J. The
+    time derivative f_t is approximated by a finite difference.
+
+    The Jacobian is computed as for ImplicitRK: from f.jacobian if
+    the model has it, otherwise by (possibly sparse) finite
+    differences.
+    """
+    transformations = {}  # the coefficients for U, for each class
+
+    def transformation(self):
+        solver_class = type(self)
+        if solver_class not in Rosenbrock.transformations:
+            alpha, Gamma = np.array(self.alpha), np.array(self.Gamma)
+            Gamma_inv = np.linalg.inv(Gamma)
+            a = alpha @ Gamma_inv
+            C = np.diag(1 / np.diag(Gamma)) - Gamma_inv
+            m = self.b @ Gamma_inv
+            e = None
+            if hasattr(self, 'bh'):
+                e = (self.b - self.bh) @ Gamma_inv
+            Rosenbrock.transformations[solver_class] = (
+                a, C, alpha.sum(axis=1), Gamma.sum(axis=1), m, e)
+        return Rosenbrock.transformations[solver_class]
+
+    def allocate_work_arrays(self):
+        super().allocate_work_arrays()
+        self.U = np.zeros((self.stages, self.neq))
+        self.f_0 = np.zeros(self.neq)
+        self.stage_f = np.zeros(self.neq)
+        self.f_t = np.zeros(self.neq)
+        self.t_first = None  # the time point of J, f_0 and f_t
+
+    def solve_stages(self):
+        """Compute the stage vectors U for the current step,
+        returned as the rows of an (s, neq) array."""
+        u, n, t = self.u, self.n, self.t
+        dt, gamma = self.dt, self.Gamma[0][0]
+        a, C, c, g, m, e = self.transformation()
+        U, u_stage = self.U, self.u_stage
+        f_0, stage_f = self.f_0, self.stage_f
+        u_n = np.reshape(u[n], self.neq)
+
+        # after a rejected step, J, f_0 and f_t are still those at
+        # (t[n], u[n]), and only the LU factorization depends on dt
+        if self.t_first != t[n]:
+            self.update_jacobian()
+            self.f_into(t[n], u_n, f_0)
+            self.time_derivative(t[n], u_n, f_0)
+            self.t_first = t[n]
+        with self.stats.timer('linear'):
+            if issparse(self.J):
+                I = identity(self.neq, format='csc')
+            else:
+                I = np.eye(self.neq)
+            solve_linear = self.factorize(I / (dt * gamma) - self.J)
+            self.stats.nlu += 1
+
+            for i in range(self.stages):
+                if c[i] == 0 and not a[i, :i].any():
+                    stage_f[...] = f_0  # the stage is evaluated at u[n]
+                else:
+                    np.dot(a[i, :i], U[:i], out=u_stage)
+                    u_stage += u_n
+                    self.f_into(t[n] + c[i] * dt, u_stage, stage_f)
+                stage_f += (C[i, :i] / dt) @ U[:i]
+                stage_f += (dt * g[i]) * self.f_t
+                U[i] = solve_linear(stage_f)
+        return U
+
+    def time_derivative(self, t, u, f_0):
+        """Forward difference approximation of df/dt at (t, u),
+        stored in self.f_t, given f_0 = f(t, u)."""
+        delta = np.sqrt(np.finfo(float).eps) * max(1, abs(t))
+        delta = (t + delta) - t
+        self.f_into(t + delta, u, self.f_t)
+        self.f_t -= f_0
+        self.f_t /= delta
+
+    def advance(self):
+        u, n = self.u, self.n
+        u_new = self.u_new
+        m = self.transformation()[4]
+        U = self.solve_stages()
+
+        np.dot(m, U, out=u_new)
+        u_new += np.reshape(u[n], self.neq)
+        return u_new.reshape(np.shape(u[n]))
+
+
+class ROS2(Rosenbrock):
+    """The L-stable second order method with two stages of
+    Verwer et al. (1999), which is also a W-method."""
+
+    def __init__(self, f):
+        super().__init__(f)
+        self.stages = 2
+        self.order = 2
+        gamma = 1 + 1 / np.sqrt(2)
+        self.alpha = [[0, 0],
+                      [1, 0]]
+        self.Gamma = [[gamma, 0],
+                      [-2 * gamma, gamma]]
+        self.b = np.array([1 / 2, 1 / 2])
+
+
+class ROS3P(Rosenbrock):
+    """The A-stable third order method of Lang and Verwer (2001),
+    designed to avoid order reduction on parabolic problems."""
+
+    def __init__(self, f):
+        super().__init__(f)
+        self.stages = 3
+        self.order = 3
+        gamma = 1 / 2 + np.sqrt(3) / 6
+        self.alpha = [[0, 0, 0],
+                      [1, 0, 0],
+                      [1, 0, 0]]
+        self.Gamma = [[gamma, 0, 0],
+                      [-1, gamma, 0],
+                      [-gamma, 1 / 2 - 2 * gamma, gamma]]
+        self.b = np.array([2 / 3, 0, 1 / 3])
+        self.bh = np.array([1 / 3, 1 / 3, 1 / 3])
+
+
+class AdaptiveRosenbrock(AdaptiveODESolver, Rosenbrock):
+
+    def allocate_work_arrays(self):
+        super().allocate_work_arrays()
+        self.error = np.zeros(self.neq)
+
+    def advance(self):
+        u, n = self.u, self.n
+        u_new, error = self.u_new, self.error
+        m, e = self.transformation()[4:]
+        U = self.solve_stages()
+
+        np.dot(m, U, out=u_new)
+        u_new += u[n]
+        np.dot(e, U, out=error)
+        return u_new, self.error_norm(error, u_new)
+
+    def step_derivatives(self):
+        # f(t[n - 1], u[n - 1]) was computed for the first stage
+        t, u, n = self.t, self.u, self.n
+        return self.f_0, self.f(t[n], u[n])
+
+
+class Rodas3(AdaptiveRosenbrock):
+    """
+    The stiffly accurate third order method with an embedded
+    second order method of Sandu et al. (1997), constructed like
+    the Rodas methods of Hairer and Wanner: the last stage is
+    evaluated at the solution of the embedded method, so the error
+    estimate is the last stage vector.
+    """
+
+    def __init__(self, f, eta=0.9):
+        super().__init__(f, eta)
+        # the step size factor is limited to [0.2, 6] as in RODAS
+        self.controller = StepSizeController(eta=eta, min_factor=0.2,
+                                             max_factor=6)
+        self.stages = 4
+        self.order = 2  # of the error estimate, for the step size
+        self.alpha = [[0, 0, 0, 0],
+                      [0, 0, 0, 0],
+                      [1, 0, 0, 0],
+                      [3 / 4, -1 / 4, 1 / 2, 0]]
+        self.Gamma = [[1 / 2, 0, 0, 0],
+                      [1, 1 / 2, 0, 0],
+                      [-1 / 4, -1 / 4, 1 / 2, 0],
+                      [1 / 12, 1 / 12, -2 / 3, 1 / 2]]
+        self.b = np.array([5 / 6, -1 / 6, -1 / 6, 1 / 2])
+        self.bh = np.array([3 / 4, -1 / 4, 1 / 2, 0])
+
+
+def test_rosenbrock_order():
+    """
+    Check the convergence rate of the Rosenbrock methods for a
+    forced oscillator, which also tests the f_t term.
+    """
+    def f(t, u):
+        return [u[1], -u[0] + 0.5 * np.cos(t)]
+
+    def u_exact(t):
+        return np.cos(t) + 0.25 * t * np.sin(t)
+
+    for solver_class in [ROS2, ROS3P]:
+        solver = solver_class(f)
+        solver.set_initial_condition([1, 0])
+        errors = []
+        for N in [80, 160]:
+            t, u = solver.solve((0, 2), N)
+            errors.append(abs(u[-1, 0] - u_exact(2)))
+        rate = np.log2(errors[0] / errors[1])
+        msg = f'{solver_class.__name__} failed with rate={rate}'
+        assert abs(rate - solver.order) < 0.1, msg
+        stats = solver.stats
+        assert stats.njev == stats.nlu == N and stats.nit == 0
+
+
+def test_rodas3():
+    """
+    Rodas3 should solve the stiff Van der Pol equation to the
+    tolerance, with one LU factorization per step, and one Jacobian
+    per accepted step, since it is kept after a rejected step.
+    """
+    from scipy.integrate import solve_ivp
+
+    def f(t, u):
+        return [u[1], 100 * (1 - u[0]**2) * u[1] - u[0]]
+
+    u_ref = solve_ivp(f, (0, 1), [2, 0], method='Radau',
+                      rtol=1e-10, atol=1e-10).y[:, -1]
+    solver = Rodas3(f)
+    solver.set_initial_condition([2, 0])
+    t, u = solver.solve((0, 1), tol=1e-5)
+    assert abs(u[-1] - u_ref).max() < 1e-3
+    t, u = solver.solve((0, 1), tol=1e-5, t_eval=[0.5, 1])
+    assert abs(u[-1] - u_ref).max() < 1e-3
+    t, u = solver.solve((0, 100), tol=1e-3)
+    stats = solver.stats
+    assert stats.nreject > 0
+    assert stats.njev == stats.naccept
+    assert stats.nlu == stats.naccept + stats.nreject
+
+
+if __name__ == '__main__':
+    from hodgkinhuxley import HodgkinHuxley
+    import matplotlib.pyplot as plt
+
+    test_rosenbrock_order()
+    test_rodas3()
+
+    model = HodgkinHuxley()
+    solver = Rodas3(model)
+    solver.set_initial_condition([-45, 0.31, 0.05, 0.59])
+    t, u = solver.solve((0, 50), tol=0.1)
+
+    plt.plot(t, u[:, 0], '+')
+    plt.show()
@@ -1,6 +1,7 @@
 """
 The code solves the Hodgkin-Huxley model with the
-RKF45, Euler-Heun, and TR-BDF2 adaptive RK solvers.
+RKF45, Euler-Heun, and TR-BDF2 adaptive RK solvers,
+and the adaptive Rosenbrock solver Rodas3.
 The global error is estimated by comparing to a
 reference solution computed by solve_ivp.
 The tolerance, global error and number of steps
@@ -8,6 +9,7 @@ are printed to the terminal.
 """
 
 from AdaptiveImplicitRK import *
+from Rosenbrock import Rodas3
 from hodgkinhuxley import *
 import matplotlib.pyplot as plt
 from scipy.integrate import solve_ivp
@@ -24,6 +26,7 @@ def exact(t):
 
 
 solvers = {'TR-BDF2': [TR_BDF2_Adaptive, 2],
+           'Rodas3': [Rodas3, 3],
            'RKF45': [RKF45, 4],
            'EulerHeun': [EulerHeun, 1],
            }
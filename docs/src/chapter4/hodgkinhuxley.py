@@ -44,6 +44,13 @@ class HodgkinHuxley:
     def beta_h(self, V):
         return 1.0 / (1.0 + np.exp(-0.1 * (V + 35.0)))
 
+    def dalpha(self, V, V0, scale):
+        """Derivative of scale * (V + V0) / (1 - exp(-0.1 * (V + V0))),
+        the form of alpha_n and alpha_m."""
+        x = V + V0
+        e = np.exp(-0.1 * x)
+        return scale * ((1.0 - e) - 0.1 * x * e) / (1.0 - e)**2
+
     def IK(self, V, n):
         return self.gK * n**4 * (V - self.EK)
 
@@ -53,11 +60,42 @@ class HodgkinHuxley:
     def IL(self, V):
         return self.gL * (V - self.EL)
 
-    def __call__(self, t, u):
+    def __call__(self, t, u, out=None):
+        # The solvers pass out to have the result stored in place
+        if out is None:
+            out = np.zeros(np.shape(u))
+        V, n, m, h = u
+        out[0] = -(self.INa(V, m, h) + self.IK(V, n) +
+                   self.IL(V) - self.I_stim(t)) / self.Cm
+        out[1] = self.alpha_n(V) * (1.0 - n) - self.beta_n(V) * n
+        out[2] = self.alpha_m(V) * (1.0 - m) - self.beta_m(V) * m
+        out[3] = self.alpha_h(V) * (1.0 - h) - self.beta_h(V) * h
+        return out
+
+    def jacobian(self, t, u):
         V, n, m, h = u
-        dVdt = -(self.INa(V, m, h) + self.IK(V, n) +
-                 self.IL(V) - self.I_stim(t)) / self.Cm
-        dndt = self.alpha_n(V) * (1.0 - n) - self.beta_n(V) * n
-        dmdt = self.alpha_m(V) * (1.0 - m) - self.beta_m(V) * m
-        dhdt = self.alpha_h(V) * (1.0 - h) - self.beta_h(V) * h
-        return [dVdt, dndt, dmdt, dhdt]
+        gK, gNa, Cm = self.gK, self.gNa, self.Cm
+        a_n, b_n = self.alpha_n(V), self.beta_n(V)
+        a_m, b_m = self.alpha_m(V), self.beta_m(V)
+        a_h, b_h = self.alpha_h(V), self.beta_h(V)
+        J = np.zeros((4, 4))
+        J[0, 0] = -(gNa * m**3 * h + gK * n**4 + self.gL) / Cm
+        J[0, 1] = -4 * gK * n**3 * (V - self.EK) / Cm
+        J[0, 2] = -3 * gNa * m**2 * h * (V - self.ENa) / Cm
+        J[0, 3] = -gNa * m**3 * (V - self.ENa) / Cm
+        J[1, 0] = self.dalpha(V, 55.0, 0.01) * (1.0 - n) + 0.0125 * b_n * n
+        J[1, 1] = -(a_n + b_n)
+        J[2, 0] = self.dalpha(V, 40.0, 0.1) * (1.0 - m) + 0.0556 * b_m * m
+        J[2, 2] = -(a_m + b_m)
+        J[3, 0] = -0.05 * a_h * (1.0 - h) - 0.1 * b_h * (1.0 - b_h) * h
+        J[3, 3] = -(a_h + b_h)
+        return J
+
+
+def test_jacobian():
+    """Compare the Jacobian with a finite difference approximation."""
+    model = HodgkinHuxley()
+    for u in [[-45, 0.31, 0.05, 0.59], [20, 0.6, 0.9, 0.2]]:
+        J = model.jacobian(0, u)
+        J_fd = finite_difference_jacobian(model, 0, u)
+        assert np.allclose(J, J_fd, rtol=1e-5, atol=1e-7 * abs(J).max())
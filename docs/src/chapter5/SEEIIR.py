@@ -16,7 +16,7 @@ class SEEIIR:
         self.p_a = p_a
         self.mu = mu
 
-    def __call__(self, t, u):
+    def __call__(self, t, u, out=None):
         beta = self.beta
         r_ia = self.r_ia
         r_e2 = self.r_e2
@@ -25,50 +25,93 @@ class SEEIIR:
         p_a = self.p_a
         mu = self.mu
 
+        # The solvers pass out to have the result stored in place
+        if out is None:
+            out = np.zeros(np.shape(u))
         S, E1, E2, I, Ia, R = u
         N = sum(u)
-        dS = -beta * S * I / N - r_ia * beta * S * Ia / N \
-            - r_e2 * beta * S * E2 / N
-        dE1 = beta * S * I / N + r_ia * beta * S * Ia / N \
-            + r_e2 * beta * S * E2 / N - lmbda_1 * E1
-        dE2 = lmbda_1 * (1 - p_a) * E1 - lmbda_2 * E2
-        dI = lmbda_2 * E2 - mu * I
-        dIa = lmbda_1 * p_a * E1 - mu * Ia
-        dR = mu * (I + Ia)
-        return [dS, dE1, dE2, dI, dIa, dR]
+        out[0] = -beta * S * I / N - r_ia * beta * S * Ia / N \
+            - r_e2 * beta * S * E2 / N                     # dS
+        out[1] = beta * S * I / N + r_ia * beta * S * Ia / N \
+            + r_e2 * beta * S * E2 / N - lmbda_1 * E1      # dE1
+        out[2] = lmbda_1 * (1 - p_a) * E1 - lmbda_2 * E2  # dE2
+        out[3] = lmbda_2 * E2 - mu * I                   # dI
+        out[4] = lmbda_1 * p_a * E1 - mu * Ia            # dIa
+        out[5] = mu * (I + Ia)                           # dR
+        return out
 
+    def jacobian(self, t, u):
+        beta = self.beta
+        r_ia = self.r_ia
+        r_e2 = self.r_e2
+        lmbda_1 = self.lmbda_1
+        lmbda_2 = self.lmbda_2
+        p_a = self.p_a
+        mu = self.mu
+
+        S, E1, E2, I, Ia, R = u
+        N = sum(u)
+        # infection term F = beta * S * W / N, with
+        W = I + r_ia * Ia + r_e2 * E2
+        dW = np.array([0, 0, r_e2, 1, r_ia, 0])
+        dF = beta * S * dW / N - beta * S * W / N**2
+        dF[0] += beta * W / N
+
+        J = np.zeros((6, 6))
+        J[0] = -dF
+        J[1] = dF
+        J[1, 1] -= lmbda_1
+        J[2, 1] = lmbda_1 * (1 - p_a)
+        J[2, 2] = -lmbda_2
+        J[3, 2] = lmbda_2
+        J[3, 3] = -mu
+        J[4, 1] = lmbda_1 * p_a
+        J[4, 4] = -mu
+        J[5, 3] = mu
+        J[5, 4] = mu
+        return J
+
+
+def test_jacobian():
+    """Compare the Jacobian with a finite difference approximation."""
+    model = SEEIIR()
+    u = [5.0e6, 2.0e4, 1.5e4, 3.0e4, 1.0e4, 4.0e5]
+    J = model.jacobian(0, u)
+    J_fd = finite_difference_jacobian(model, 0, u)
+    assert np.allclose(J, J_fd, rtol=1e-5, atol=1e-7 * abs(J).max())
 
-S_0 = 5.5e6
-E1_0 = 0.0
-E2_0 = 100.0
-I_0 = 0.0
-Ia_0 = 0.0
-R_0 = 0.0
-U0 = [S_0, E1_0, E2_0, I_0, Ia_0, R_0]
 
+if __name__ == '__main__':
+    S_0 = 5.5e6
+    E1_0 = 0.0
+    E2_0 = 100.0
+    I_0 = 0.0
+    Ia_0 = 0.0
+    R_0 = 0.0
+    U0 = [S_0, E1_0, E2_0, I_0, Ia_0, R_0]
 
-model = SEEIIR()
-solver = RungeKutta4(model)
-solver.set_initial_condition(U0)
+    model = SEEIIR()
+    solver = RungeKutta4(model)
+    solver.set_initial_condition(U0)
 
-t_span = (0, 300)
-N = 200
-t, u = solver.solve(t_span, N)
-S = u[:, 0]
-E1 = u[:, 1]
-E2 = u[:, 2]
-I = u[:, 3]
-Ia = u[:, 4]
-R = u[:, 5]
+    t_span = (0, 300)
+    N = 200
+    t, u = solver.solve(t_span, N)
+    S = u[:, 0]
+    E1 = u[:, 1]
+    E2 = u[:, 2]
+    I = u[:, 3]
+    Ia = u[:, 4]
+    R = u[:, 5]
 
-print(max(I))
-plt.plot(t, S, label='S')
-plt.plot(t, I, label='I')
-plt.plot(t, Ia, label='Ia')
-plt.plot(t, R, label='R')
-plt.legend()
-plt.title('Disease dynamics predicted by the SEEIIR model')
-plt.xlabel('Time (days)')
-plt.ylabel('People in each category')
-plt.savefig('seir_fig0.pdf')
-plt.show()
+    print(max(I))
+    plt.plot(t, S, label='S')
+    plt.plot(t, I, label='I')
+    plt.plot(t, Ia, label='Ia')
+    plt.plot(t, R, label='R')
+    plt.legend()
+    plt.title('Disease dynamics predicted by the SEEIIR model')
+    plt.xlabel('Time (days)')
+    plt.ylabel('People in each category')
+    plt.savefig('seir_fig0.pdf')
+    plt.show()
@@ -19,21 +19,22 @@ class SEIR:
         return [dS, dE, dI, dR]
 
 
-S0 = 1000
-E0 = 0
-I0 = 1
-R0 = 0
-model = SEIR(beta=1.0, mu=1.0 / 5, nu=1.0 / 7, gamma=1.0 / 50)
+if __name__ == '__main__':
+    S0 = 1000
+    E0 = 0
+    I0 = 1
+    R0 = 0
+    model = SEIR(beta=1.0, mu=1.0 / 5, nu=1.0 / 7, gamma=1.0 / 50)
 
-solver = RungeKutta4(model)
-solver.set_initial_condition([S0, E0, I0, R0])
-t_span = (0, 100)
-t, u = solver.solve(t_span, N=101)
+    solver = RungeKutta4(model)
+    solver.set_initial_condition([S0, E0, I0, R0])
+    t_span = (0, 100)
+    t, u = solver.solve(t_span, N=101)
 
-S = u[:, 0]
-E = u[:, 1]
-I = u[:, 2]
-R = u[:, 3]
+    S = u[:, 0]
+    E = u[:, 1]
+    I = u[:, 2]
+    R = u[:, 3]
 
-plt.plot(t, S, t, E, t, I, t, R)
-plt.show()
+    plt.plot(t, S, t, E, t, I, t, R)
+    plt.show()
@@ -23,22 +23,23 @@ class SIR:
         return [dS, dI, dR]
 
 
-S0 = 1000
-I0 = 1
-R0 = 0
+if __name__ == '__main__':
+    S0 = 1000
+    I0 = 1
+    R0 = 0
 
-model = SIR(beta=0.001, nu=1 / 7.0, gamma=1.0 / 50)
-solver = RungeKutta4(model)
-solver.set_initial_condition([S0, I0, R0])
-t_span = (0, 100)
-t, u = solver.solve(t_span, N=101)
-S = u[:, 0]
-I = u[:, 1]
-R = u[:, 2]
+    model = SIR(beta=0.001, nu=1 / 7.0, gamma=1.0 / 50)
+    solver = RungeKutta4(model)
+    solver.set_initial_condition([S0, I0, R0])
+    t_span = (0, 100)
+    t, u = solver.solve(t_span, N=101)
+    S = u[:, 0]
+    I = u[:, 1]
+    R = u[:, 2]
 
-plt.plot(t, S, t, I, t, R)
-plt.legend(['S', 'I', 'R'])
-plt.xlabel('Time (days)')
-plt.ylabel('Number of people')
-plt.savefig('SIR_immunity_loss.pdf')
-plt.show()
+    plt.plot(t, S, t, I, t, R)
+    plt.legend(['S', 'I', 'R'])
+    plt.xlabel('Time (days)')
+    plt.ylabel('Number of people')
+    plt.savefig('SIR_immunity_loss.pdf')
+    plt.show()
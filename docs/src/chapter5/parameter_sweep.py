@@ -0,0 +1,123 @@
+"""
+Parameter sweeps for the compartment models (SIR, SEIR, SEEIIR),
+where the same model is solved for many different parameter
+values. The solves are independent, so they are distributed over
+a pool of worker processes, and the results are returned in the
+same order as the parameter sets.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+
+def parameter_grid(**values):
+    """All combinations of the given parameter values, as a list
+    of dicts. For instance, parameter_grid(beta=[1.0, 2.0],
+    nu=[0.1, 0.2, 0.3]) gives six parameter sets."""
+    names = list(values)
+    return [dict(zip(names, combination))
+            for combination in product(*values.values())]
+
+
+def solve_one(model_class, params, solver_class, u0, t_span,
+              solve_args, solve_kwargs):
+    if isinstance(params, dict):
+        model = model_class(**params)
+    else:
+        model = model_class(*params)
+    solver = solver_class(model)
+    solver.set_initial_condition(u0)
+    return solver.solve(t_span, *solve_args, **solve_kwargs)
+
+
+def solve_batch(task):
+    model_class, batch, *args = task
+    return [solve_one(model_class, params, *args) for params in batch]
+
+
+def sweep(model_class, parameters, solver_class, u0, t_span, *solve_args,
+          max_workers=None, batch_size=None, **solve_kwargs):
+    """
+    Solve the model model_class(**params) for each parameter set
+    in parameters, and yield the results of solver.solve in the
+    same order as the parameter sets, as soon as they are ready.
+    The parameter sets are dicts of keyword arguments, e.g. from
+    parameter_grid, or sequences of positional arguments, such as
+    the rows of an array of parameter samples. Remaining arguments
+    are passed on to solve, e.g.
+
+    sweep(SEIR, samples, RungeKutta4, u0, (0, 100), 1000,
+          components=[2], save_every=10)
+
+    The parameter sets are sent to the workers in batches of
+    batch_size. By default there are about 16 batches per worker,
+    so that workers that finish early (e.g. adaptive solves with
+    few steps) pick up the remaining batches, and the load is
+    balanced. With max_workers=1 the solves run in this process.
+    """
+    parameters = list(parameters)
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    if batch_size is None:
+        batch_size = max(1, len(parameters) // (16 * max_workers))
+    tasks = [(model_class, parameters[i:i + batch_size], solver_class,
+              u0, t_span, solve_args, solve_kwargs)
+             for i in range(0, len(parameters), batch_size)]
+
+    if max_workers == 1:
+        for task in tasks:
+            yield from solve_batch(task)
+        return
+    with ProcessPoolExecutor(max_workers) as executor:
+        for results in executor.map(solve_batch, tasks):
+            yield from results
+
+
+def test_sweep():
+    """
+    Check that a parallel sweep gives the same results,
+    in the same order, as solving one by one.
+    """
+    import numpy as np
+    from ODESolver import RungeKutta4
+    from SEIR import SEIR
+
+    u0 = [1000, 0, 1, 0]
+    t_span = (0, 100)
+    grid = parameter_grid(beta=[0.5, 1.0, 1.5], mu=[1 / 5], nu=[1 / 7],
+                          gamma=[0, 1 / 50])
+    results = list(sweep(SEIR, grid, RungeKutta4, u0, t_span, 100,
+                         max_workers=2, batch_size=2, final_only=True))
+    assert len(results) == len(grid)
+    for params, (t, u) in zip(grid, results):
+        solver = RungeKutta4(SEIR(**params))
+        solver.set_initial_condition(u0)
+        t_ref, u_ref = solver.solve(t_span, 100)
+        assert t == t_ref[-1] and np.array_equal(u, u_ref[-1])
+
+
+if __name__ == '__main__':
+    """
+    Sweep over the infection rate in the SEIR model, and compare
+    the time with solving the same problems one by one.
+    """
+    import time
+    import numpy as np
+    from ODESolver import RungeKutta4
+    from SEIR import SEIR
+
+    u0 = [1000, 0, 1, 0]
+    betas = np.linspace(0.2, 2.0, 200)
+    samples = [(beta, 1 / 5, 1 / 7, 1 / 50) for beta in betas]
+
+    for max_workers in [1, os.cpu_count()]:
+        t0 = time.perf_counter()
+        peaks = [u.max() for t, u in
+                 sweep(SEIR, samples, RungeKutta4, u0, (0, 100), 1000,
+                       max_workers=max_workers, components=2)]
+        elapsed = time.perf_counter() - t0
+        print(f'{max_workers} worker(s): {elapsed:.2f} s, '
+              f'{len(samples) / elapsed:.0f} solves per second')
+    print(f'Largest number of infected: {max(peaks):.1f} '
+          f'for beta = {betas[np.argmax(peaks)]:.2f}')